@@ -23,21 +23,27 @@ def index() -> flask.Response:
 
 @api_bp.route('/logs')
 def logs() -> flask.Response:
-    ns = get_ns()
-    if not hasattr(ns, 'logs'):
-        return flask.jsonify([])
-    logs = ns.logs
+    """Query parameters: `since` (only entries with a greater id), `limit`
+    (only the newest entries) and `level` (minimum level, e.g. 'warning')."""
+    args = flask.request.args
+    since = args.get('since', -1, type=int)
+    limit = args.get('limit', None, type=int)
+    level = args.get('level', None, type=str)
+    logs = get_client().get_logs().read(since, limit, level)
     return flask.jsonify(logs)
 
 
 @api_bp.route('/drones', methods=['GET'])
 def drone_positions() -> flask.Response:
-    return flask.jsonify(get_ns().drone_positions)
+    return flask.jsonify(get_client().get_cached('drone_positions'))
+
+
+def get_client() -> manager.Client:
+    return cast(manager.Client, flask.current_app.config['MANAGER_CLIENT'])
 
 
 def get_ns() -> Namespace:
-    ns = flask.current_app.config['MANAGER_CLIENT'].get_ns()
-    return cast(Namespace, ns)
+    return get_client().get_ns()
 
 
 T = TypeVar('T')
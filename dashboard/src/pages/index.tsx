@@ -1,7 +1,8 @@
 import { useMemo } from 'react'
 
-import { Turbine, Drone, Log } from '@/types'
+import { Turbine, Drone } from '@/types'
 import { useSwr } from '@/utils/fetch.util'
+import { useLogs } from '@/utils/logs.util'
 import Statuses from '@/components/home/Statuses'
 import Logs from '@/components/home/Logs'
 import Weather from '@/components/home/Weather'
@@ -28,9 +29,7 @@ export default function Home() {
 	const { data: drData, error: drError } = useSwr<Drone[]>('/drones', {
 		refreshInterval: 30_000,
 	})
-	const { data: logData, error: logError } = useSwr<Log[]>('/logs', {
-		refreshInterval: 10_000,
-	})
+	const { data: logData, error: logError } = useLogs(10_000)
 
 	const wtStatuses = useMemo(() => {
 		const statuses = { running: 0, failure: 0, warning: 0, idle: 0 }
@@ -52,7 +51,7 @@ export default function Home() {
 
 	const logs = useMemo(() => {
 		if (!logData) return []
-		return logData
+		return [...logData]
 			.sort((a, b) => b.time_seconds - a.time_seconds)
 			.slice(0, 4)
 			.map((datum) => {
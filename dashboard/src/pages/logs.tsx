@@ -1,9 +1,8 @@
 import { useState, useEffect, useMemo } from 'react'
 
-import { Log } from '@/types'
 import { logStatuses } from '@/config/index.config'
 import { capitalise } from '@/utils/index.utils'
-import { useSwr } from '@/utils/fetch.util'
+import { useLogs } from '@/utils/logs.util'
 import Dropdown from '@/components/Dropdown'
 import Table, { Column, Data as TableData } from '@/components/Table'
 import LoadingSpinner from '@/components/LoadingSpinner'
@@ -91,7 +90,7 @@ export default function Logs() {
 	const [logs, setLogs] = useState<Data | null>()
 	const [statusFilterValue, setStatusFilterValue] = useState(statusFilters[0])
 
-	const { data } = useSwr<Log[]>('/logs', { refreshInterval: 10_000 })
+	const { data } = useLogs(10_000)
 
 	useEffect(() => {
 		if (!data) return
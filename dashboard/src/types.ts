@@ -52,6 +52,7 @@ export interface Env {
 export type LogLevel = 'info' | 'warning' | 'failure'
 
 export interface Log {
+	id: number
 	level: LogLevel
 	msg: string
 	time_seconds: number
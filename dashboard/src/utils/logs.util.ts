@@ -0,0 +1,34 @@
+import { useEffect, useState } from 'react'
+
+import { Log } from '@/types'
+import { useSwr } from '@/utils/fetch.util'
+
+// Number of logs fetched on the first load and kept afterwards
+const MAX_LOGS = 500
+
+const lastId = (logs?: Log[]) =>
+	logs && logs.length ? logs[logs.length - 1].id : null
+
+// Polls the logs, fetching only the entries after the newest one seen and
+// appending them to the ones already fetched (oldest first)
+export const useLogs = (refreshInterval: number) => {
+	const [logs, setLogs] = useState<Log[]>()
+
+	const since = lastId(logs)
+	const url =
+		since === null ? `/logs?limit=${MAX_LOGS}` : `/logs?since=${since}`
+	const { data, error } = useSwr<Log[]>(url, { refreshInterval })
+
+	useEffect(() => {
+		if (!data) return
+
+		setLogs((logs = []) => {
+			const newest = lastId(logs) ?? -1
+			const newLogs = data.filter((log) => log.id > newest)
+			if (!newLogs.length) return logs
+			return [...logs, ...newLogs].slice(-MAX_LOGS)
+		})
+	}, [data])
+
+	return { data: logs, error }
+}
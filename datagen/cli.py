@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
+from pathlib import Path
+from types import FrameType
+from typing import Optional, Tuple
 import argparse
+import os
 import random
 import logging
+import signal
+import time
 import yaml
 import logging.config
 
 import datagen as dg
 import manager
+import manager.shm
+from manager.codec import SCHEMA_ATTR, ReadingsCodec, ReadingsSchema
 
 
 _CFG_PATHS = [
@@ -38,72 +46,272 @@ def main() -> None:
     parser.add_argument('--warmup', type=int, default=10,
                         help='Number of ticks to "warm up" the simulation '
                              'after initialisation')
+    parser.add_argument('--shared_memory', type=str, default=None,
+                        metavar='NAME',
+                        help='Additionally publish the readings to a shared '
+                             'memory segment with this name, for services '
+                             'running on the same host')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes simulating the turbines '
+                             '(object engine only), the readings do not '
+                             'depend on it')
+    parser.add_argument('--checkpoint', type=Path, default=None,
+                        metavar='PATH',
+                        help='Periodically save the state of the simulation '
+                             'to this file')
+    parser.add_argument('--checkpoint_interval', type=int, default=600,
+                        metavar='TICKS',
+                        help='Number of ticks between checkpoints')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue from the checkpoint instead of '
+                             'initialising and warming up the simulation, if '
+                             'the checkpoint exists')
+    parser.add_argument('--waveform_spill', type=Path, default=None,
+                        metavar='DIR',
+                        help='Also write the raw waveform blocks to '
+                             'memory-mapped files in this directory, if '
+                             'waveforms are enabled in the config')
+    parser.add_argument('--waveform_spill_ticks', type=int, default=16,
+                        metavar='TICKS',
+                        help='Number of ticks of waveforms kept in the files')
+    parser.add_argument('--record', type=Path, default=None, metavar='DIR',
+                        help='Record the published readings and applied '
+                             'faults to this directory, see the replay '
+                             'command')
     manager.common.add_logging_args(parser)
     manager.add_manager_arguments(parser)
+    commands = parser.add_subparsers(dest='command')
+    generate = commands.add_parser(
+            'generate', help='Run the simulation as fast as possible without '
+                             'a manager and write the readings to files')
+    generate.add_argument('--ticks', type=int, required=True,
+                          help='Number of ticks to generate')
+    generate.add_argument('--out', type=Path, required=True,
+                          help='Output directory')
+    generate.add_argument('--chunk_ticks', type=int, default=1024,
+                          help='Number of ticks per output file')
+    replay = commands.add_parser(
+            'replay', help='Publish recorded readings to the manager instead '
+                           'of simulating them')
+    replay.add_argument('recording', type=Path,
+                        help='Directory of the recording')
+    replay.add_argument('--speed', type=float, default=1.,
+                        help='Multiple of the recorded ticks per second, 0 '
+                             'to replay as fast as possible')
+    replay.add_argument('--start', type=int, default=None, metavar='TICK',
+                        help='First tick to replay')
+    replay.add_argument('--stop', type=int, default=None, metavar='TICK',
+                        help='Tick to stop before')
+    map_ = commands.add_parser(
+            'map', help='Write a synthetic map with the area and models of '
+                        '--map, deterministic from --seed (0 by default)')
+    map_.add_argument('--turbines', type=int, required=True)
+    map_.add_argument('--stations', type=int, default=9)
+    map_.add_argument('--drones', type=int, default=4)
+    map_.add_argument('--layout', choices=dg.mapgen.LAYOUTS, default='grid')
+    map_.add_argument('--spacing', type=float, default=None,
+                      help='Minimum distance of the turbines in metres, '
+                           'derived from the area by default')
+    map_.add_argument('--models', type=_model_weight, nargs='+', default=[],
+                      metavar='NAME=WEIGHT',
+                      help='Relative weights of the models, equal by '
+                           'default')
+    map_.add_argument('--spec', action='store_true',
+                      help='Only write the spec, which is expanded when '
+                           'the map is read')
+    map_.add_argument('--out', type=Path, required=True,
+                      help='Output map file')
     # Parse arguments
     args = parser.parse_args()
+    if args.command == 'replay' and args.speed < 0:
+        parser.error('--speed must not be negative')
     manager.common.init_logging(args)
     logger.info(f'Loaded logging config from {args.logging_config}')
     # Check that a config exists
-    if args.config is None:
+    if args.config is None and args.command != 'replay':
         logger.error(f'No config found or specified, searched in {_CFG_PATHS}')
         exit(1)
     # RNG seed
     if args.seed is not None:
         random.seed(args.seed)
+    if args.command == 'generate':
+        _generate(args)
+        return
+    if args.command == 'map':
+        _write_map(args)
+        return
     # Get the global namespace
     client = manager.Client.from_args('datagen_sim', args)
+    if args.command == 'replay':
+        _replay(args, client)
+        return
     # Write the static map data to Namespace.map_cfg
-    with open(args.map) as fh:
-        d = yaml.safe_load(fh)
+    d = dg.mapgen.read_map(args.map)
     client.get_ns().time_seconds = 0.
     client.get_ns().map_cfg = d
     # Initialise the simulation
     sim = _build_sim(args, client)
+    client.get_readings().set_capacity(sim.cfg.history_length)
+    # Readings are published in a compact binary encoding, the consumers
+    # decode them using the schema in the namespace
+    codec = ReadingsCodec(ReadingsSchema.from_reading(sim.get_readings()))
+    setattr(client.get_ns(), SCHEMA_ATTR, codec.schema.to_dict())
+    shared = None
+    if args.shared_memory is not None:
+        shared = manager.shm.SharedReadings.create(
+                args.shared_memory, sim.cfg.history_length,
+                sim.wt_ids)
+        setattr(client.get_ns(), manager.shm.SPEC_ATTR, shared.spec)
+    recorder = None
+    if args.record is not None:
+        recorder = dg.recording.Recorder(args.record, codec.schema, sim.cfg,
+                                         d)
 
     def loop_callback(readings: dg.types.ReadingsT) -> None:
         """Write the simulation results to the global namespace."""
-        ns = client.get_ns()
-        ns.time_seconds = sim.ticks * sim.cfg.tick_freq
-        if hasattr(ns, 'finished_inspections'):
-            for wt_id in ns.finished_inspections:
-                wts = [w for w in sim.wts if w.id == wt_id]
-                if not wts:
-                    continue
-                wt = wts[0]
-                wt.faults = []
-        if not hasattr(ns, 'readings_queue'):
-            ns.readings_queue = []
-            logger.info('Initialised readings queue in global namespace')
-        queue = ns.readings_queue
-        if hasattr(ns, 'add_faults'):
-            for wt_id in ns.add_faults:
-                wts = [w for w in sim.wts if w.id == wt_id]
-                if not wts:
-                    continue
-                wt = wts[0]
-                wt.faults.append(dg.types.RotorBladeSurfaceCrack(
-                    wt, rps_factor=0.9))
-                msg = f'Manually added a fault to WT[{wt.id}]'
-                logger.info(msg)
-                client.log(msg, 'warning')
-            ns.add_faults = []
-        if len(queue) > sim.cfg.history_length:
-            queue.pop()
-        queue.insert(0, readings)
-        ns.readings_queue = queue
+        # Write to shared memory first, `commit_tick` wakes up the readers
+        if shared is not None:
+            shared.push(readings)
+        # Publish the tick and collect the commands from the other services
+        # in a single round-trip
+        packed = codec.encode(readings)
+        commands = client.commit_tick(
+                packed, sim.ticks * sim.cfg.tick_freq,
+                inboxes=('finished_inspections', 'add_faults'))
+        for wt_id in commands['finished_inspections']:
+            sim.clear_faults(wt_id)
+        added = []
+        for wt_id in commands['add_faults']:
+            if not sim.add_fault(wt_id, dg.types.RotorBladeSurfaceCrack, 0.9):
+                continue
+            added.append(wt_id)
+            msg = f'Manually added a fault to WT[{wt_id}]'
+            logger.info(msg)
+            client.log(msg, 'warning')
+        if recorder is not None:
+            recorder.append(packed, dict(
+                finished_inspections=commands['finished_inspections'],
+                add_faults=added))
 
+    def stop(signum: int, _: Optional[FrameType]) -> None:
+        """Stop the loop after the current tick on SIGTERM and the first
+        SIGINT, a second SIGINT interrupts it."""
+        if signum == signal.SIGINT and not sim.running:
+            raise KeyboardInterrupt
+        logger.info(f'Received {signal.Signals(signum).name}, stopping')
+        sim.running = False
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
     # Run the simulation, using the above callback for the data generated by
     # the former.
-    sim.loop(loop_callback)
+    try:
+        sim.loop(loop_callback)
+    finally:
+        if sim.checkpoint_path is not None:
+            if sim.ticking:
+                logger.warning('Interrupted during a tick, not writing a '
+                               'final checkpoint')
+            else:
+                sim.save_checkpoint(sim.checkpoint_path)
+                logger.info(f'Wrote a final checkpoint at tick {sim.ticks} '
+                            f'to {sim.checkpoint_path}')
+        sim.close()
+        if shared is not None:
+            shared.close()
+        if recorder is not None:
+            recorder.close()
+
+
+def _generate(args: argparse.Namespace) -> None:
+    sim = _build_sim(args, None)
+    logger.info(f'Generating {args.ticks} ticks to {args.out}')
+    try:
+        tps = dg.export.generate(sim, args.ticks, args.out,
+                                 args.chunk_ticks)
+    finally:
+        sim.close()
+    logger.info(f'Done, {tps:.1f} ticks/s')
+
+
+def _model_weight(s: str) -> Tuple[str, float]:
+    name, _, weight = s.rpartition('=')
+    return name, float(weight)
+
+
+def _write_map(args: argparse.Namespace) -> None:
+    spec = dg.mapgen.MapSpec(
+            base=args.map, turbines=args.turbines, stations=args.stations,
+            drones=args.drones, layout=args.layout, spacing=args.spacing,
+            models=dict(args.models),
+            seed=0 if args.seed is None else args.seed)
+    with open(args.out, 'w') as fh:
+        if args.spec:
+            base = os.path.relpath(spec.base, args.out.parent)
+            yaml.safe_dump(dict(generate=dict(vars(spec), base=base)), fh,
+                           sort_keys=False)
+        else:
+            dg.mapgen.SyntheticMap(spec).write(fh)
+    logger.info(f'Wrote {args.out}')
 
 
-def _build_sim(args: argparse.Namespace, client: manager.Client
+def _replay(args: argparse.Namespace, client: manager.Client) -> None:
+    recording = dg.recording.Recording(args.recording)
+    try:
+        start = time.perf_counter()
+        ticks = dg.recording.replay(client, recording, args.speed,
+                                    args.start, args.stop)
+    except ValueError as e:
+        logger.error(str(e))
+        exit(1)
+    finally:
+        recording.close()
+    tps = ticks / max(time.perf_counter() - start, 1e-9)
+    logger.info(f'Done, {tps:.1f} ticks/s')
+
+
+def _build_sim(args: argparse.Namespace, client: Optional[manager.Client]
                ) -> dg.types.Simulation:
+    if args.resume and args.checkpoint is not None \
+            and args.checkpoint.exists():
+        sim = dg.types.Simulation.load_checkpoint(args.checkpoint, client,
+                                                  args.workers)
+        logger.info(f'Resumed from {args.checkpoint} at tick {sim.ticks}')
+    else:
+        sim = _init_sim(args, client)
+    sim.checkpoint_path = args.checkpoint
+    sim.checkpoint_interval = args.checkpoint_interval
+    if sim.waveforms is not None and args.waveform_spill is not None:
+        sim.waveform_spill = dg.waveforms.WaveformSpill(
+                args.waveform_spill, sim.cfg, sim.wt_ids,
+                args.waveform_spill_ticks)
+    return sim
+
+
+def _init_sim(args: argparse.Namespace, client: Optional[manager.Client]
+              ) -> dg.types.Simulation:
     cfg = dg.config.Config.from_yaml(args.config)
-    env = dg.types.Environment.from_config(cfg)
-    wts = dg.types.wind_turbines_from_config(env, args.map)
-    sim = dg.types.Simulation(client, cfg, wts, env)
+    # Independent random number streams, all derived from the seed
+    streams = dg.streams.Streams(args.seed)
+    env = dg.types.Environment.from_config(cfg, streams)
+    if cfg.engine == 'arrays':
+        fleet = dg.types.Fleet.from_config(env, args.map, streams)
+        sim = dg.types.Simulation(client, cfg, [], env, fleet=fleet)
+    elif cfg.engine == 'objects':
+        wts = dg.types.wind_turbines_from_config(env, args.map, streams)
+        if args.workers > 1:
+            pool = dg.pool.TurbinePool(wts, cfg, args.workers)
+            sim = dg.types.Simulation(client, cfg, [], env, pool=pool)
+        else:
+            sim = dg.types.Simulation(client, cfg, wts, env)
+    else:
+        raise ValueError(f'Unknown engine: {cfg.engine}, expected "objects" '
+                         'or "arrays"')
+    if cfg.wind_field:
+        sim.wind_field = dg.windfield.WindField.from_config(
+                cfg, args.map, streams.wind_field())
+    if cfg.waveform_samples > 0:
+        sim.waveforms = dg.waveforms.Waveforms(cfg, streams)
     logger.info('Starting warmup')
     sim.tick(args.warmup)
     logger.info('Done')
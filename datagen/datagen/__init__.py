@@ -1,3 +1,11 @@
 from . import config  # noqa: F401
 from . import types  # noqa: F401
 from . import api  # noqa: F401
+from . import export  # noqa: F401
+from . import mapgen  # noqa: F401
+from . import pool  # noqa: F401
+from . import streams  # noqa: F401
+from . import timing  # noqa: F401
+from . import waveforms  # noqa: F401
+from . import windfield  # noqa: F401
+from . import recording  # noqa: F401
@@ -1,8 +1,10 @@
 from multiprocessing.managers import Namespace
-from typing import Tuple
+from typing import Any, Dict, List, Optional, Tuple
 import flask
-from copy import copy
 from typing import cast
+from manager import Client
+from manager.codec import decode_all
+from manager.shm import SPEC_ATTR, SharedReadings, try_attach
 
 from .utils import is_idle_device, set_idle_device, list_idle_devices
 
@@ -12,7 +14,7 @@ datagen_bp = flask.Blueprint('datagen', __name__)
 
 @datagen_bp.route('/readings')
 def readings() -> flask.Response:
-    return flask.jsonify(get_ns().readings_queue)
+    return flask.jsonify(latest_readings())
 
 
 def add_status(turbine, is_idle):
@@ -27,7 +29,7 @@ def add_status(turbine, is_idle):
 
 @datagen_bp.route('/wind-turbines', methods=['GET'])
 def wind_turbines_list() -> flask.Response:
-    readings = get_ns().readings_queue[0]['wts']
+    readings = latest_readings(1)[0]['wts']
     IDLE_DEVICES = set(list_idle_devices())
     for turbine in readings:
         add_status(turbine, turbine["wt_id"] in IDLE_DEVICES)
@@ -36,19 +38,21 @@ def wind_turbines_list() -> flask.Response:
 
 @datagen_bp.route('/add-fault/<wt_id>', methods=['GET', 'POST'])
 def add_fault(wt_id: str) -> flask.Response:
-    ns = get_ns()
-    if hasattr(ns, 'add_faults'):
-        add_faults = ns.add_faults
-    else:
-        add_faults = []
-    add_faults.append(wt_id)
-    ns.add_faults = add_faults
+    # Picked up by the simulation on its next tick
+    get_ns().extend('add_faults', [wt_id])
     return flask.jsonify({'msg': 'success'})
 
 
 @datagen_bp.route('/wind-turbines/<wt_id>', methods=['GET'])
 def wind_turbines_detail(wt_id: str) -> Tuple[flask.Response, int]:
-    readings = get_ns().readings_queue[-24:] # Get last 24 readings (24h if 1 tick = 1h) for historical data
+    n = 24  # Get last 24 readings (24h if 1 tick = 1h) for historical data
+    shared = get_shared_readings()
+    if shared is not None and wt_id not in shared.wt_ids:
+        shared = None
+    if shared is not None:
+        readings = latest_readings(1)
+    else:
+        readings = latest_readings(n)
     wts = readings[0]['wts']
     filtered = [wt for wt in wts if wt['wt_id'] == wt_id]
     if not filtered:
@@ -61,10 +65,17 @@ def wind_turbines_detail(wt_id: str) -> Tuple[flask.Response, int]:
     rotor_rps = []
     power = []
 
-    for reading in readings:
-        wt = [wt for wt in reading['wts'] if wt['wt_id'] == wt_id][0]
-        rotor_rps.append(wt['rotor_rps'])
-        power.append(wt['power'])
+    if shared is not None:
+        # Read the history straight out of shared memory
+        _, values = shared.latest(n)
+        wt_values = values[:, shared.wt_ids.index(wt_id)]
+        rotor_rps = wt_values[:, shared.column('rotor_rps')].tolist()
+        power = wt_values[:, shared.column('power')].tolist()
+    else:
+        for reading in readings:
+            wt = [wt for wt in reading['wts'] if wt['wt_id'] == wt_id][0]
+            rotor_rps.append(wt['rotor_rps'])
+            power.append(wt['power'])
 
     turbine['rotor_rps'] = rotor_rps
     turbine['power'] = power
@@ -74,7 +85,7 @@ def wind_turbines_detail(wt_id: str) -> Tuple[flask.Response, int]:
 
 @datagen_bp.route('/wind-turbines/<wt_id>/disable', methods=['POST'])
 def wind_turbines_disable(wt_id: str) -> Tuple[flask.Response, int]:
-    readings = get_ns().readings_queue[0]['wts']
+    readings = latest_readings(1)[0]['wts']
     filtered = [wt for wt in readings if wt['wt_id'] == wt_id]
     if not filtered:
         return flask.jsonify({'msg': 'Not found'}), 404
@@ -85,7 +96,7 @@ def wind_turbines_disable(wt_id: str) -> Tuple[flask.Response, int]:
 
 @datagen_bp.route('/wind-turbines/<wt_id>/enable', methods=['POST'])
 def wind_turbines_enable(wt_id: str) -> Tuple[flask.Response, int]:
-    readings = get_ns().readings_queue[0]['wts']
+    readings = latest_readings(1)[0]['wts']
     filtered = [wt for wt in readings if wt['wt_id'] == wt_id]
     if not filtered:
         return flask.jsonify({'msg': 'Not found'}), 404
@@ -96,19 +107,43 @@ def wind_turbines_enable(wt_id: str) -> Tuple[flask.Response, int]:
 
 @datagen_bp.route('/env-sensors', methods=['GET'])
 def env_readings() -> flask.Response:
-    readings = copy(get_ns().readings_queue[0])
+    readings = latest_readings(1)[0]
     del readings['wts']
     return flask.jsonify(readings)
 
 
 @datagen_bp.route('/map', methods=['GET'])
 def map_() -> flask.Response:
-    m = get_ns().map_cfg
-    drones = get_ns().drone_positions
-    m['drones'] = drones
+    client = get_client()
+    # Copy, as the cached map must not be modified
+    m = dict(client.get_cached('map_cfg'))
+    m['drones'] = client.get_cached('drone_positions')
     return flask.jsonify(m)
 
 
+def get_client() -> Client:
+    return cast(Client, flask.current_app.config['MANAGER_CLIENT'])
+
+
 def get_ns() -> Namespace:
-    ns = flask.current_app.config['MANAGER_CLIENT'].get_ns()
-    return cast(Namespace, ns)
+    return get_client().get_ns()
+
+
+def latest_readings(n: Optional[int] = None) -> List[Dict[str, Any]]:
+    """The `n` newest readings as dicts, newest first."""
+    client = get_client()
+    return decode_all(client.get_codec(), client.get_readings().latest(n))
+
+
+def get_shared_readings() -> Optional[SharedReadings]:
+    """Shared memory readings if datagen publishes them on this host."""
+    config = flask.current_app.config
+    version, shared = config.get('SHARED_READINGS', (0, None))
+    changed = get_client().get_if_changed(SPEC_ATTR, version)
+    if changed is not None:
+        version, spec = changed
+        if shared is not None:
+            shared.close()
+        shared = try_attach(spec)
+        config['SHARED_READINGS'] = (version, shared)
+    return cast(Optional[SharedReadings], shared)
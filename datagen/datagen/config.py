@@ -11,6 +11,13 @@ logger = logging.getLogger('datagen')
 @dataclass
 class Config:
     _ticks_per_second: float = 1.
+    # What the simulation loop does when it falls behind its schedule: run
+    # the missed ticks without waiting ('batch') or run them without
+    # publishing their readings ('drop')
+    _catch_up: str = 'batch'
+    # Number of ticks the loop may fall behind before it gives up catching
+    # up and restarts its schedule from the current time
+    _max_lag: int = 10
     wts: int = 3  # Number of wind turbines
     tick_freq: int = 60 * 60  # seconds
     # Wind
@@ -41,6 +48,21 @@ class Config:
     gen_temp_diff_var: float = 0.5  # degree Celsius
     # Data
     history_length: int = 1024  # in ticks
+    # Spatial wind field with wakes, see `windfield.py`. Needs the positions
+    # of the turbines in the map
+    wind_field: bool = False
+    wind_field_bins: int = 72  # Wind direction bins of the wake geometry
+    wind_field_scale: float = 20e3  # metres, of the spatial variations
+    wind_field_std: float = 0.1  # Relative std of the speed
+    wake_decay: float = 0.05  # Growth of the wake radius per metre
+    wake_thrust: float = 0.8  # Thrust coefficient of the turbines
+    # High-rate waveform channels, published as features, see `waveforms.py`
+    waveform_samples: int = 0  # per tick and channel, 0 disables them
+    waveform_rate: float = 25.6e3  # Hz
+    waveform_bands: int = 8
+    # Simulation engine of the turbines: 'objects' (`WindTurbine`) or
+    # 'arrays' (`Fleet`, vectorized, for large fleets)
+    engine: str = 'objects'
 
     @property
     def ticks_per_day(self) -> float:
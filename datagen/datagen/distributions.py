@@ -1,58 +1,129 @@
+"""Random processes of the environment. The values are generated in blocks of
+`BLOCK_TICKS` ticks with NumPy and handed out one by one by the iterators.
+The processes are plain objects rather than closures, so that they can be
+pickled in checkpoints."""
 import math
-import random
-from itertools import count
-from typing import Iterator
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+import numpy as np
 
 from .config import Config
-from .utils import Autocorr, Vec2, isum
+from .utils import BLOCK_TICKS, BlockAutocorr, Blocks, FloatArray, Vec2
+
+
+@dataclass
+class _Seasonal:
+    """Gaussian noise around a sine with a period of 1."""
+    rng: np.random.Generator
+    spread: float
+    std: float
+
+    def __call__(self, x: FloatArray) -> FloatArray:
+        seasonal: FloatArray = np.sin(2 * math.pi * x) * 0.5 * self.spread
+        return seasonal + self.rng.normal(0., self.std, len(x))
+
+
+@dataclass
+class _Normal:
+    rng: np.random.Generator
+    mean: float
+    std: float
+
+    def __call__(self, x: FloatArray) -> FloatArray:
+        return self.rng.normal(self.mean, self.std, len(x))
+
+
+@dataclass
+class _Uniform:
+    rng: np.random.Generator
+    high: float
+
+    def __call__(self, x: FloatArray) -> FloatArray:
+        return self.rng.random(len(x)) * self.high
+
+
+@dataclass
+class _Sum:
+    """Blocks of a constant plus `BlockAutocorr`s."""
+    const: float
+    autocorrs: List[BlockAutocorr]
 
+    def __call__(self) -> FloatArray:
+        x = np.full(BLOCK_TICKS, self.const)
+        for autocorr in self.autocorrs:
+            x += autocorr.next_block()
+        return x
 
-def make_temp_iter(cfg: Config) -> Iterator[float]:
-    def annual_dist(x: float) -> float:
-        annual = math.sin(2 * math.pi * x)
-        annual = annual * 0.5 * cfg.temp_annual_spread
-        return random.gauss(annual, cfg.temp_annual_std)
 
-    def daily_dist(x: float) -> float:
-        daily = math.sin(2 * math.pi * x)
-        daily = daily * 0.5 * cfg.temp_daily_spread
-        return random.gauss(daily, cfg.temp_daily_std)
+@dataclass
+class _Clipped:
+    """Blocks of a `BlockAutocorr`, bounded below and optionally wrapped."""
+    autocorr: BlockAutocorr
+    low: float = -math.inf
+    period: Optional[float] = None
 
-    annual_iter = Autocorr(dist=annual_dist,
+    def __call__(self) -> FloatArray:
+        x = np.maximum(self.low, self.autocorr.next_block())
+        return x if self.period is None else x % self.period
+
+
+@dataclass
+class _Noise:
+    """Blocks of independent Gaussian values."""
+    rng: np.random.Generator
+    std: float
+
+    def __call__(self) -> FloatArray:
+        return self.rng.normal(0., self.std, BLOCK_TICKS)
+
+
+@dataclass
+class _Waves:
+    wind_iter: Iterator[Vec2]
+    noise: Blocks
+
+    def __next__(self) -> float:
+        return max(0., max(next(self.wind_iter).mag, 1.) + next(self.noise))
+
+    def __iter__(self) -> Iterator[float]:
+        return self
+
+
+def make_temp_iter(cfg: Config, rng: np.random.Generator) -> Iterator[float]:
+    annual = BlockAutocorr(dist=_Seasonal(rng, cfg.temp_annual_spread,
+                                          cfg.temp_annual_std), rng=rng,
                            alpha=0.1, beta=5,
                            increment=1 / cfg.ticks_per_year)
-    daily_iter = Autocorr(dist=daily_dist,
+    daily = BlockAutocorr(dist=_Seasonal(rng, cfg.temp_daily_spread,
+                                         cfg.temp_daily_std), rng=rng,
                           alpha=0.5, beta=10,
                           increment=1 / cfg.ticks_per_day)
-    mean_iter = (cfg.temp_mean for _ in count())
-    return isum(0., mean_iter, daily_iter, annual_iter)
-
-
-def make_wind_iter(cfg: Config) -> Iterator[Vec2]:
-    angle_autocorr = Autocorr(dist=lambda _: random.random() * math.pi * 4,
-                              alpha=0.5, beta=10,
-                              increment=1 / cfg.ticks_per_day)
-    angle_iter = (x % (2 * math.pi) for x in angle_autocorr)
-    mag_autocorr = Autocorr(dist=lambda _: random.gauss(cfg.wind_mag_mean,
-                                                        cfg.wind_mag_var),
-                            alpha=0.5, beta=10,
-                            increment=1 / cfg.ticks_per_day)
-    mag_iter = (max(0, x) for x in mag_autocorr)
+    return Blocks(_Sum(cfg.temp_mean, [daily, annual]))
+
+
+def make_wind_iter(cfg: Config, rng: np.random.Generator) -> Iterator[Vec2]:
+    angle_autocorr = BlockAutocorr(dist=_Uniform(rng, math.pi * 4), rng=rng,
+                                   alpha=0.5, beta=10,
+                                   increment=1 / cfg.ticks_per_day)
+    angle_iter = Blocks(_Clipped(angle_autocorr, period=2 * math.pi))
+    mag_autocorr = BlockAutocorr(dist=_Normal(rng, cfg.wind_mag_mean,
+                                              cfg.wind_mag_var), rng=rng,
+                                 alpha=0.5, beta=10,
+                                 increment=1 / cfg.ticks_per_day)
+    mag_iter = Blocks(_Clipped(mag_autocorr, low=0.))
     wind_iter = map(Vec2, angle_iter, mag_iter)
     return wind_iter
 
 
-def make_wave_iter(cfg: Config, wind_iter: Iterator[Vec2]) -> Iterator[float]:
-    mags = (max(w.mag, 1.) for w in wind_iter)
-    mags = (mag + random.gauss(0., cfg.wind_mag_var) for mag in mags)
-    mags = (max(0., mag) for mag in mags)
-    return mags
+def make_wave_iter(cfg: Config, wind_iter: Iterator[Vec2],
+                   rng: np.random.Generator) -> Iterator[float]:
+    return _Waves(wind_iter, Blocks(_Noise(rng, cfg.wind_mag_var)))
 
 
-def make_vis_iter(cfg: Config) -> Iterator[float]:
-    vis_autocorr = Autocorr(dist=lambda _: random.gauss(cfg.vis_mean,
-                                                        cfg.vis_var),
-                            alpha=0.5, beta=10,
-                            increment=1 / cfg.ticks_per_day)
-    vis_iter = (max(10., x) for x in vis_autocorr)
+def make_vis_iter(cfg: Config, rng: np.random.Generator) -> Iterator[float]:
+    vis_autocorr = BlockAutocorr(dist=_Normal(rng, cfg.vis_mean, cfg.vis_var),
+                                 rng=rng, alpha=0.5, beta=10,
+                                 increment=1 / cfg.ticks_per_day)
+    vis_iter = Blocks(_Clipped(vis_autocorr, low=10.))
     return vis_iter
@@ -0,0 +1,115 @@
+"""Headless generation of simulation data, e.g. for model training. The
+simulation runs as fast as possible without a manager and the readings are
+written in chunks of consecutive ticks, so memory stays bounded:
+
+    out/schema.json              field names, turbine ids, tick_freq
+    out/part-000000000/ticks.npy     [ticks]
+    out/part-000000000/env.npy       [ticks, env_fields]
+    out/part-000000000/wts.npy       [ticks, turbines, wt_fields]
+    out/part-000000000/faults.json   {tick: {wt_id: faults}}, only faults
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+import json
+import logging
+import time
+import numpy as np
+import numpy.typing as npt
+
+from manager.codec import ReadingsSchema
+
+from .types import ReadingT, Simulation
+
+
+logger = logging.getLogger('datagen')
+
+
+class ChunkWriter:
+    """Collects readings and writes them to `out` every `chunk_ticks`
+    ticks."""
+
+    def __init__(self, out: Path, schema: ReadingsSchema, chunk_ticks: int,
+                 tick_freq: float) -> None:
+        self.out = out
+        self.schema = schema
+        self.chunk_ticks = chunk_ticks
+        n_wts, n_fields = len(schema.wt_ids), len(schema.wt_fields)
+        self._ticks: npt.NDArray[np.int64] = np.zeros(chunk_ticks, np.int64)
+        self._env: npt.NDArray[np.float64] = np.zeros(
+                (chunk_ticks, len(schema.env_fields)))
+        self._wts: npt.NDArray[np.float64] = np.zeros(
+                (chunk_ticks, n_wts, n_fields))
+        self._faults: Dict[int, Dict[str, List[str]]] = {}
+        self._n = 0
+        out.mkdir(parents=True, exist_ok=True)
+        with open(out / 'schema.json', 'w') as fh:
+            json.dump(dict(schema.to_dict(), tick_freq=tick_freq), fh)
+
+    def append(self, tick: int, env: Dict[str, ReadingT],
+               wt_values: npt.NDArray[np.float64],
+               faults: Dict[str, List[str]]) -> None:
+        """Add the readings of a tick: the environment readings, turbine
+        values of shape [turbines, wt_fields] and the faults by turbine."""
+        i = self._n
+        self._ticks[i] = tick
+        self._env[i] = [env[k] for k in self.schema.env_fields]
+        self._wts[i] = wt_values
+        if faults:
+            self._faults[tick] = faults
+        self._n += 1
+        if self._n == self.chunk_ticks:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._n:
+            return
+        n = self._n
+        part = self.out / f'part-{int(self._ticks[0]):09d}'
+        part.mkdir(exist_ok=True)
+        np.save(part / 'ticks.npy', self._ticks[:n])
+        np.save(part / 'env.npy', self._env[:n])
+        np.save(part / 'wts.npy', self._wts[:n])
+        with open(part / 'faults.json', 'w') as fh:
+            json.dump(self._faults, fh)
+        self._faults = {}
+        self._n = 0
+
+
+def generate(sim: Simulation, ticks: int, out: Path, chunk_ticks: int = 1024
+             ) -> float:
+    """Run the simulation for `ticks` ticks, writing the readings to `out`.
+    Returns the number of ticks per second."""
+    schema = ReadingsSchema.from_reading(sim.get_readings())
+    writer = ChunkWriter(out, schema, chunk_ticks, sim.cfg.tick_freq)
+    start = last_report = time.perf_counter()
+    for i in range(ticks):
+        writer.append(sim.ticks, sim.env.get_readings(),
+                      *_wt_readings(sim, schema.wt_fields))
+        sim.tick()
+        now = time.perf_counter()
+        if now - last_report >= 5:
+            last_report = now
+            logger.info(f'Generated {i + 1}/{ticks} ticks '
+                        f'({(i + 1) / (now - start):.1f} ticks/s)')
+    writer.flush()
+    return ticks / max(time.perf_counter() - start, 1e-9)
+
+
+def _wt_readings(sim: Simulation, fields: Sequence[str]
+                 ) -> Tuple[npt.NDArray[np.float64], Dict[str, List[str]]]:
+    """Turbine values and faults, without building the readings dicts if
+    the simulation uses the array engine."""
+    if sim.fleet is not None:
+        fleet = sim.fleet
+        faults = {wt_id: list(wt_faults)
+                  for wt_id, wt_faults in zip(fleet.ids, fleet.faults)
+                  if wt_faults}
+        extra = sim.waveform_features() if sim.waveforms is not None \
+            else None
+        return fleet.values(fields, extra), faults
+    wts = sim.get_readings()['wts']
+    assert isinstance(wts, list)
+    values = np.array([[wt[k] for k in fields] for wt in wts],
+                      dtype=np.float64)
+    return values, {wt['wt_id']: wt['_faults'] for wt in wts if wt['_faults']}
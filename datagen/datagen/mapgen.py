@@ -0,0 +1,315 @@
+"""Synthetic maps with many turbines, for scaling tests. A map is generated
+from a small spec: the area, models and view of a base map, the numbers of
+turbines, stations and drones, the placement of the turbines in the area and
+the mix of models. The same spec and seed always give the same map.
+
+A map file may consist of just the spec under a `generate` key, e.g.
+
+    generate:
+      base: map.yaml  # relative to this file
+      turbines: 100000
+      stations: 50
+      drones: 200
+      layout: poisson  # or grid
+      spacing: 150  # minimum distance of turbines in metres, optional
+      models: {AREVA-M5000-116: 3, Vestas-V164-8.0: 1}  # relative weights
+      seed: 0
+
+which `read_map` and `iter_turbines` expand on the fly, so that no huge YAML
+file has to be written and parsed. The turbines are placed once per version
+of the file, see `synthetic_map`. `SyntheticMap.write` writes the expanded
+map, streaming the turbines."""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+import json
+import math
+import numpy as np
+import numpy.typing as npt
+import yaml
+
+from .streams import Streams
+from .utils import EARTH_RADIUS, FloatArray
+
+
+LAYOUTS = ('grid', 'poisson')
+# Spawn keys of the random streams of a map
+_PLACEMENT, _MODELS, _STATIONS = 0, 1, 2
+# Number of turbines formatted at once when streaming
+_CHUNK = 4096
+# Candidates per placed turbine in each round of Poisson-disk sampling, and
+# the number of rounds without any new turbine before giving up
+_CANDIDATES = 2
+_MAX_FAILED_ROUNDS = 20
+# Default spacing of the Poisson-disk layout relative to sqrt(area / turbines),
+# random sequential packing saturates at about 0.83
+_POISSON_SPACING = 0.7
+
+
+@dataclass
+class MapSpec:
+    base: Path
+    turbines: int
+    stations: int = 9
+    drones: int = 4
+    layout: str = 'grid'
+    spacing: Optional[float] = None
+    # Relative weights of the models of the base map, equal by default
+    models: Dict[str, float] = field(default_factory=dict)
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        if self.layout not in LAYOUTS:
+            raise ValueError(f'Unknown layout: {self.layout}, expected one '
+                             f'of {LAYOUTS}')
+        if self.turbines < 0 or self.stations < 1 or self.drones < 0:
+            raise ValueError('Expected a non-negative number of turbines and '
+                             'drones and at least one station')
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any], root: Path) -> MapSpec:
+        """Spec from the `generate` section of the map file in `root`."""
+        d = dict(d)
+        d['base'] = root / d.get('base', 'map.yaml')
+        return cls(**d)
+
+
+class SyntheticMap:
+
+    def __init__(self, spec: MapSpec) -> None:
+        self.spec = spec
+        with open(spec.base) as fh:
+            self.base: Dict[str, Any] = yaml.safe_load(fh)
+        self.streams = Streams(spec.seed)
+        lat_lng = np.array([[p['lat'], p['lng']] for p in self.base['area']],
+                           dtype=np.float64)
+        self.origin = lat_lng.mean(axis=0)
+        self.area = self.project(lat_lng)
+
+    def project(self, lat_lng: FloatArray) -> FloatArray:
+        """Metres east and north of the origin, from [lat, lng] pairs."""
+        lat0 = math.radians(self.origin[0])
+        d = np.radians(lat_lng - self.origin)
+        xy: FloatArray = np.stack([d[:, 1] * math.cos(lat0), d[:, 0]],
+                                  axis=-1) * EARTH_RADIUS
+        return xy
+
+    def unproject(self, xy: FloatArray) -> FloatArray:
+        lat0 = math.radians(self.origin[0])
+        d = xy / EARTH_RADIUS
+        lat_lng: FloatArray = np.degrees(
+                np.stack([d[:, 1], d[:, 0] / math.cos(lat0)], axis=-1)) \
+            + self.origin
+        return lat_lng
+
+    def header(self) -> Dict[str, Any]:
+        """Everything but the turbines."""
+        d = {k: v for k, v in self.base.items() if k != 'turbines'}
+        stations = self.unproject(self._uniform(
+                np.random.default_rng(self.streams.child(_STATIONS)),
+                self.spec.stations))
+        d['stations'] = [dict(id=f'Station_{i + 1:03}', lat=float(lat),
+                              lng=float(lng))
+                         for i, (lat, lng) in enumerate(stations)]
+        # Drones start at the stations
+        d['drones'] = [dict(d['stations'][i % len(stations)],
+                            id=f'Drone_{i + 1:03}')
+                       for i in range(self.spec.drones)]
+        return d
+
+    def turbines(self) -> Iterator[Dict[str, Any]]:
+        """The turbines, created lazily from the placement arrays."""
+        names = [m['name'] for m in self.base['models']]
+        width = max(3, len(str(self.spec.turbines)))
+        for i, ((lat, lng), model) in enumerate(zip(self.lat_lng.tolist(),
+                                                    self.model_index)):
+            yield dict(id=f'Turbine_{i + 1:0{width}}', model=names[model],
+                       lat=lat, lng=lng)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.header(), turbines=list(self.turbines()))
+
+    def write(self, fh: TextIO) -> None:
+        yaml.safe_dump(self.header(), fh, sort_keys=False)
+        fh.write('turbines:\n')
+        lines: List[str] = []
+        for wt in self.turbines():
+            # JSON strings are valid YAML and much faster to format
+            lines.append(f'- id: {json.dumps(wt["id"])}\n'
+                         f'  model: {json.dumps(wt["model"])}\n'
+                         f'  lat: {wt["lat"]!r}\n  lng: {wt["lng"]!r}\n')
+            if len(lines) == _CHUNK:
+                fh.writelines(lines)
+                lines.clear()
+        fh.writelines(lines)
+
+    @cached_property
+    def lat_lng(self) -> FloatArray:
+        rng = np.random.default_rng(self.streams.child(_PLACEMENT))
+        if self.spec.layout == 'grid':
+            xy = self._grid(self.spec.turbines)
+        else:
+            xy = self._poisson(rng, self.spec.turbines)
+        return self.unproject(xy)
+
+    @cached_property
+    def model_index(self) -> npt.NDArray[np.intp]:
+        names = [m['name'] for m in self.base['models']]
+        unknown = set(self.spec.models) - set(names)
+        if unknown:
+            raise ValueError(f'Unknown models: {sorted(unknown)}')
+        weights = np.array([self.spec.models.get(name, 0.)
+                            if self.spec.models else 1. for name in names])
+        rng = np.random.default_rng(self.streams.child(_MODELS))
+        index: npt.NDArray[np.intp] = rng.choice(
+                len(names), self.spec.turbines, p=weights / weights.sum())
+        return index
+
+    def _default_spacing(self, n: int) -> float:
+        return math.sqrt(polygon_area(self.area) / max(n, 1))
+
+    def _grid(self, n: int) -> FloatArray:
+        """`n` points of the largest square grid (with `spacing` if given)
+        that fits them, evenly spread over the points in the area."""
+        spacing = self.spec.spacing or self._default_spacing(n)
+        low, high = self.area.min(axis=0), self.area.max(axis=0)
+        while True:
+            x, y = np.meshgrid(np.arange(low[0], high[0], spacing),
+                               np.arange(low[1], high[1], spacing))
+            xy = np.stack([x.ravel(), y.ravel()], axis=-1)
+            xy = xy[in_polygon(xy, self.area)]
+            if len(xy) >= n:
+                break
+            if self.spec.spacing is not None:
+                raise ValueError(f'Only {len(xy)} turbines fit in the area '
+                                 f'with a spacing of {spacing} m')
+            spacing *= 0.98
+        indices = np.linspace(0, len(xy) - 1, n).round().astype(np.intp)
+        points: FloatArray = xy[indices]
+        return points
+
+    def _poisson(self, rng: np.random.Generator, n: int) -> FloatArray:
+        """`n` uniformly random points at least `spacing` apart, placed in
+        rounds of candidates that are checked against the placed points and
+        each other on a grid of cells holding at most one point."""
+        r = self.spec.spacing or _POISSON_SPACING * self._default_spacing(n)
+        cell = r / math.sqrt(2)
+        low = self.area.min(axis=0)
+        shape = np.ceil((self.area.max(axis=0) - low) / cell).astype(np.intp)
+        # Index of the point in each cell or -1, padded by the 2 cells that
+        # are checked around each cell
+        grid = np.full(shape + 4, -1, dtype=np.intp)
+        offsets = [(i, j) for i in range(-2, 3) for j in range(-2, 3)
+                   if (i, j) != (0, 0)]
+        points = np.zeros((n, 2))
+        placed, failed = 0, 0
+        while placed < n:
+            xy = self._uniform(rng, _CANDIDATES * (n - placed))
+            ij = ((xy - low) / cell).astype(np.intp) + 2
+            # One candidate per empty cell
+            ok = grid[ij[:, 0], ij[:, 1]] < 0
+            _, first = np.unique(ij[ok], axis=0, return_index=True)
+            first.sort()
+            xy, ij = xy[ok][first], ij[ok][first]
+            ok = np.ones(len(xy), dtype=bool)
+            for di, dj in offsets:
+                other = grid[ij[:, 0] + di, ij[:, 1] + dj]
+                near = other >= 0
+                dist = np.hypot(*(points[other[near]] - xy[near]).T)
+                ok[np.flatnonzero(near)[dist < r]] = False
+            xy, ij = xy[ok], ij[ok]
+            # Candidates too close to an earlier candidate of the same round
+            candidates = np.full_like(grid, -1)
+            candidates[ij[:, 0], ij[:, 1]] = np.arange(len(xy))
+            ok = np.ones(len(xy), dtype=bool)
+            for di, dj in offsets:
+                other = candidates[ij[:, 0] + di, ij[:, 1] + dj]
+                near = (other >= 0) & (other < np.arange(len(xy)))
+                dist = np.hypot(*(xy[other[near]] - xy[near]).T)
+                ok[np.flatnonzero(near)[dist < r]] = False
+            xy, ij = xy[ok][:n - placed], ij[ok][:n - placed]
+            grid[ij[:, 0], ij[:, 1]] = np.arange(placed, placed + len(xy))
+            points[placed:placed + len(xy)] = xy
+            placed += len(xy)
+            failed = 0 if len(xy) else failed + 1
+            if failed == _MAX_FAILED_ROUNDS:
+                raise ValueError(f'Only {placed} turbines fit in the area '
+                                 f'with a spacing of {r:.1f} m')
+        return points
+
+    def _uniform(self, rng: np.random.Generator, n: int) -> FloatArray:
+        """`n` uniformly random points in the area."""
+        low, high = self.area.min(axis=0), self.area.max(axis=0)
+        fraction = polygon_area(self.area) / np.prod(high - low)
+        chunks: List[FloatArray] = []
+        missing = n
+        while missing > 0:
+            xy = rng.uniform(low, high, (int(missing / fraction) + 16, 2))
+            xy = xy[in_polygon(xy, self.area)][:missing]
+            chunks.append(xy)
+            missing -= len(xy)
+        return np.concatenate(chunks) if chunks else np.zeros((0, 2))
+
+
+def polygon_area(polygon: FloatArray) -> float:
+    x, y = polygon.T
+    return abs(float(np.dot(x, np.roll(y, -1))
+                     - np.dot(y, np.roll(x, -1)))) / 2
+
+
+def in_polygon(points: FloatArray, polygon: FloatArray
+               ) -> npt.NDArray[np.bool_]:
+    """Whether each point is inside the polygon (even-odd rule)."""
+    x, y = points[:, 0], points[:, 1]
+    inside = np.zeros(len(points), dtype=bool)
+    for (x0, y0), (x1, y1) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        crosses = (y0 > y) != (y1 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def _load(path: Path) -> Dict[str, Any]:
+    with open(path) as fh:
+        d: Dict[str, Any] = yaml.safe_load(fh)
+    return d
+
+
+def synthetic_map(path: Path) -> SyntheticMap:
+    """The map of the spec in `path`. Cached by path and modification time,
+    so that the turbines are placed once however often an unchanged spec is
+    read."""
+    return _synthetic_map(path.absolute(), path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=4)
+def _synthetic_map(path: Path, mtime_ns: int) -> SyntheticMap:
+    return SyntheticMap(MapSpec.from_dict(_load(path)['generate'],
+                                          path.parent))
+
+
+def read_map(path: Path) -> Dict[str, Any]:
+    """The map in `path`, generated if it is a spec."""
+    d = _load(path)
+    if 'generate' not in d:
+        return d
+    return synthetic_map(path).to_dict()
+
+
+def iter_turbines(path: Path) -> Iterator[Dict[str, Any]]:
+    """The turbines of the map in `path`, generated lazily if it is a spec."""
+    d = _load(path)
+    if 'generate' not in d:
+        return iter(d['turbines'])
+    return synthetic_map(path).turbines()
+
+
+def read_models(path: Path) -> List[Dict[str, Any]]:
+    """The models of the map in `path`, or of its base map."""
+    d = _load(path)
+    if 'generate' not in d:
+        return list(d['models'])
+    return [dict(m) for m in synthetic_map(path).base['models']]
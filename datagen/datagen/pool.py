@@ -0,0 +1,152 @@
+"""Process-pool mode of the object engine: the wind turbines are split into
+contiguous shards, each simulated by a worker process, while the environment
+is advanced by the main process and sent to the workers every tick. Since
+every turbine has its own random number generators (see `Streams`), the
+readings are identical to those of a single-process simulation."""
+from __future__ import annotations
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+import logging
+import multiprocessing
+import numpy as np
+
+from .config import Config
+from .types import (Environment, Fault, ReadingT, WindTurbine,
+                    waveform_inputs)
+from .utils import FloatArray
+
+
+logger = logging.getLogger('datagen')
+
+
+class TurbinePool:
+
+    def __init__(self, wts: Sequence[WindTurbine], cfg: Config,
+                 workers: int) -> None:
+        workers = max(1, min(workers, len(wts)))
+        self.ids = [wt.id for wt in wts]
+        bounds = [len(wts) * i // workers for i in range(workers + 1)]
+        self._slices = [slice(start, stop)
+                        for start, stop in zip(bounds, bounds[1:])]
+        self._conns: List[Connection] = []
+        self._worker_of: Dict[str, int] = {}
+        self._processes = []
+        for i, (start, stop) in enumerate(zip(bounds, bounds[1:])):
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                    target=_worker, args=(worker_conn, wts[start:stop], cfg),
+                    name=f'datagen-worker-{i}', daemon=True)
+            process.start()
+            worker_conn.close()
+            self._conns.append(conn)
+            self._processes.append(process)
+            self._worker_of.update((wt.id, i) for wt in wts[start:stop])
+        logger.info(f'Simulating {len(wts)} turbines in {workers} worker '
+                    'processes')
+
+    def tick(self, env: Environment, winds: Optional[FloatArray] = None
+             ) -> List[str]:
+        """Advance all turbines, returns a message for each new fault.
+        `winds` are the wind speeds at the turbines, if not that of the
+        environment."""
+        if winds is None:
+            shards = self._all('tick', env.state)
+        else:
+            shards = self._scatter('tick', [(env.state, winds[s].tolist())
+                                            for s in self._slices])
+        return [msg for msgs in shards for msg in msgs]
+
+    def get_readings(self, env: Environment) -> List[Dict[str, ReadingT]]:
+        return [readings for shard in self._all('readings', env.state)
+                for readings in shard]
+
+    def waveform_inputs(self) -> Dict[str, FloatArray]:
+        shards = self._all('waveform_inputs')
+        return {k: np.concatenate([shard[k] for shard in shards])
+                for k in shards[0]}
+
+    def turbines(self) -> List[WindTurbine]:
+        """Copies of the turbines of all workers, e.g. for checkpoints."""
+        return [wt for shard in self._all('turbines') for wt in shard]
+
+    def clear_faults(self, wt_id: str) -> bool:
+        return self._one(wt_id, 'clear_faults', wt_id)
+
+    def add_fault(self, wt_id: str, fault_cls: Type[Fault], factor: float
+                  ) -> bool:
+        return self._one(wt_id, 'add_fault', wt_id, fault_cls, factor)
+
+    def close(self) -> None:
+        for conn in self._conns:
+            conn.send(('close',))
+            conn.close()
+        for process in self._processes:
+            process.join()
+
+    def _all(self, cmd: str, *args: Any) -> List[Any]:
+        # Send to all workers first, so that they run in parallel
+        for conn in self._conns:
+            conn.send((cmd, *args))
+        return [conn.recv() for conn in self._conns]
+
+    def _scatter(self, cmd: str, args: List[Tuple[Any, ...]]) -> List[Any]:
+        """Like `_all`, with different arguments for each worker."""
+        for conn, worker_args in zip(self._conns, args):
+            conn.send((cmd, *worker_args))
+        return [conn.recv() for conn in self._conns]
+
+    def _one(self, wt_id: str, cmd: str, *args: Any) -> bool:
+        worker = self._worker_of.get(wt_id)
+        if worker is None:
+            return False
+        self._conns[worker].send((cmd, *args))
+        return bool(self._conns[worker].recv())
+
+
+def _worker(conn: Connection, wts: List[WindTurbine], cfg: Config) -> None:
+    worker = _Worker(wts, cfg)
+    try:
+        while True:
+            cmd, *args = conn.recv()
+            if cmd == 'close':
+                break
+            conn.send(getattr(worker, cmd)(*args))
+    except (EOFError, KeyboardInterrupt):
+        # The main process went away or is being interrupted as well
+        pass
+
+
+class _Worker:
+
+    def __init__(self, wts: List[WindTurbine], cfg: Config) -> None:
+        self.wts = wts
+        self.cfg = cfg
+        self._by_id = {wt.id: wt for wt in wts}
+
+    def tick(self, state: Tuple[float, ...],
+             winds: Optional[List[float]] = None) -> List[str]:
+        env = Environment.fixed(self.cfg, state)
+        if winds is not None:
+            for wt, mag in zip(self.wts, winds):
+                wt.wind_mag = mag
+        return [msg for wt in self.wts for msg in wt.tick(env)]
+
+    def readings(self, state: Tuple[float, ...]
+                 ) -> List[Dict[str, ReadingT]]:
+        env = Environment.fixed(self.cfg, state)
+        return [wt.get_readings(env) for wt in self.wts]
+
+    def turbines(self) -> List[WindTurbine]:
+        return self.wts
+
+    def waveform_inputs(self) -> Dict[str, FloatArray]:
+        return waveform_inputs(self.wts, self.cfg)
+
+    def clear_faults(self, wt_id: str) -> bool:
+        self._by_id[wt_id].faults = []
+        return True
+
+    def add_fault(self, wt_id: str, fault_cls: Type[Fault], factor: float
+                  ) -> bool:
+        self._by_id[wt_id].add_fault(fault_cls, factor)
+        return True
@@ -0,0 +1,216 @@
+"""Recording of the published readings, to replay a run without simulating
+it, e.g. to debug alerts or load-test the other services. The readings are
+stored packed by `ReadingsCodec`, in append-only files with a tick index:
+
+    out/meta.json       readings schema, map and the timing of the config
+    out/readings.bin    packed readings, one after the other
+    out/events.bin      commands applied in each tick (JSON), e.g. faults
+    out/index.bin       [tick, offset, length, events offset, events length]
+                        per tick (int64), in increasing tick order
+
+Data is written before the index, so the index only refers to complete
+records and a recording can be read while it is written. `replay` publishes
+the ticks of a recording to the manager."""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import json
+import logging
+import mmap
+import os
+import time
+import numpy as np
+import numpy.typing as npt
+
+import manager
+import manager.shm
+from manager.codec import SCHEMA_ATTR, PackedReading, ReadingsSchema
+
+from .config import Config
+
+
+logger = logging.getLogger('datagen')
+
+
+INDEX_DTYPE = np.dtype([('tick', '<i8'), ('offset', '<i8'), ('length', '<i8'),
+                        ('events_offset', '<i8'), ('events_length', '<i8')])
+EventsT = Dict[str, List[Any]]
+
+
+class Recorder:
+    """Appends published ticks to a recording, creating it if needed. An
+    existing recording is continued if it has the same schema, ticks at or
+    after the first appended one (e.g. after resuming from an older
+    checkpoint) are dropped from the index."""
+
+    def __init__(self, out: Path, schema: ReadingsSchema, cfg: Config,
+                 map_cfg: Optional[Dict[str, Any]] = None) -> None:
+        self.out = out
+        out.mkdir(parents=True, exist_ok=True)
+        meta = dict(schema=schema.to_dict(), map_cfg=map_cfg,
+                    tick_freq=cfg.tick_freq,
+                    ticks_per_second=cfg._ticks_per_second,
+                    history_length=cfg.history_length)
+        if (out / 'meta.json').exists():
+            with open(out / 'meta.json') as fh:
+                old_schema = json.load(fh)['schema']
+            if ReadingsSchema.from_dict(old_schema) != schema:
+                raise ValueError(f'Recording in {out} has a different '
+                                 'schema')
+        with open(out / 'meta.json', 'w') as fh:
+            json.dump(meta, fh)
+        self._readings = open(out / 'readings.bin', 'ab')
+        self._events = open(out / 'events.bin', 'ab')
+        self._index = open(out / 'index.bin', 'ab')
+        self._checked = False
+
+    def append(self, reading: PackedReading, events: EventsT) -> None:
+        if not self._checked:
+            self._drop_from(reading.ticks)
+            self._checked = True
+        events_data = json.dumps(events).encode() \
+            if any(events.values()) else b''
+        entry = np.array([(reading.ticks, self._readings.tell(), len(reading),
+                           self._events.tell(), len(events_data))],
+                         dtype=INDEX_DTYPE)
+        self._readings.write(reading.data)
+        self._events.write(events_data)
+        self._readings.flush()
+        self._events.flush()
+        self._index.write(entry.tobytes())
+        self._index.flush()
+
+    def close(self) -> None:
+        for fh in (self._readings, self._events, self._index):
+            fh.close()
+
+    def _drop_from(self, tick: int) -> None:
+        index = np.fromfile(self.out / 'index.bin', dtype=INDEX_DTYPE)
+        keep = int(np.searchsorted(index['tick'], tick))
+        if keep < len(index):
+            logger.info(f'Dropping {len(index) - keep} ticks from tick '
+                        f'{tick} on from the recording')
+            self._index.truncate(keep * INDEX_DTYPE.itemsize)
+            self._index.seek(0, os.SEEK_END)
+
+
+class Recording:
+    """Random access to the ticks of a recording, which is memory-mapped."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path / 'meta.json') as fh:
+            self.meta: Dict[str, Any] = json.load(fh)
+        self.schema = ReadingsSchema.from_dict(self.meta['schema'])
+        self._files = [open(path / name, 'rb')
+                       for name in ('readings.bin', 'events.bin')]
+        self._maps: List[Optional[mmap.mmap]] = [None, None]
+        self.index: npt.NDArray[Any] = np.zeros(0, dtype=INDEX_DTYPE)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Map the ticks appended since the last refresh."""
+        self.index = np.fromfile(self.path / 'index.bin', dtype=INDEX_DTYPE)
+        for i, fh in enumerate(self._files):
+            old = self._maps[i]
+            if old is not None:
+                # Readings are copied out of the maps, so none refers to it
+                old.close()
+                self._maps[i] = None
+            if os.fstat(fh.fileno()).st_size:
+                self._maps[i] = mmap.mmap(fh.fileno(), 0,
+                                          access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def first_tick(self) -> Optional[int]:
+        """`None` if the recording is empty."""
+        return int(self.index['tick'][0]) if len(self.index) else None
+
+    @property
+    def last_tick(self) -> Optional[int]:
+        """`None` if the recording is empty."""
+        return int(self.index['tick'][-1]) if len(self.index) else None
+
+    def rows(self, start: Optional[int] = None, stop: Optional[int] = None
+             ) -> range:
+        """Rows of the index of the ticks in [start, stop)."""
+        ticks = self.index['tick']
+        return range(0 if start is None else
+                     int(np.searchsorted(ticks, start)),
+                     len(ticks) if stop is None else
+                     int(np.searchsorted(ticks, stop)))
+
+    def __getitem__(self, row: int) -> Tuple[PackedReading, EventsT]:
+        """The reading and the events of a row of the index."""
+        _, offset, length, events_offset, events_length = \
+            self.index[row].tolist()
+        readings, events = self._maps
+        assert readings is not None
+        reading = PackedReading(readings[offset:offset + length])
+        if not events_length:
+            return reading, {}
+        assert events is not None
+        return reading, json.loads(
+                events[events_offset:events_offset + events_length])
+
+    def read(self, start: Optional[int] = None, stop: Optional[int] = None
+             ) -> Iterator[Tuple[PackedReading, EventsT]]:
+        """Readings and events of the ticks in [start, stop)."""
+        for row in self.rows(start, stop):
+            yield self[row]
+
+    def close(self) -> None:
+        for m in self._maps:
+            if m is not None:
+                m.close()
+        for fh in self._files:
+            fh.close()
+
+
+def replay(client: manager.Client, recording: Recording, speed: float = 1.,
+           start: Optional[int] = None, stop: Optional[int] = None) -> int:
+    """Publish the ticks in [start, stop) of a recording, `speed` times as
+    fast as they were recorded, or as fast as possible if `speed` is 0.
+    Returns the number of published ticks, and raises a `ValueError` if
+    `speed` is negative or no ticks are in [start, stop).
+
+    The readings buffer is cleared first, so it only holds ticks of the
+    recording, and the shared memory readings of a previous datagen are
+    withdrawn. Consumers resync as after a datagen restart: if the last tick
+    a consumer saw is later than the replayed ones, `wait_since` returns all
+    readings of the buffer and the consumer starts over, see
+    `manager.readings.ReadingsBuffer`."""
+    if speed < 0:
+        raise ValueError(f'Negative replay speed: {speed}')
+    rows = recording.rows(start, stop)
+    if not rows:
+        if not len(recording):
+            raise ValueError(f'Recording in {recording.path} is empty')
+        raise ValueError(f'No ticks in [{start}, {stop}), the recording has '
+                         f'ticks {recording.first_tick} to '
+                         f'{recording.last_tick}')
+    meta = recording.meta
+    ns = client.get_ns()
+    if meta['map_cfg'] is not None:
+        ns.map_cfg = meta['map_cfg']
+    readings = client.get_readings()
+    readings.clear()
+    readings.set_capacity(meta['history_length'])
+    setattr(ns, manager.shm.SPEC_ATTR, None)
+    setattr(ns, SCHEMA_ATTR, recording.schema.to_dict())
+    period = 0. if speed == 0 else 1 / (meta['ticks_per_second'] * speed)
+    logger.info(f'Replaying {len(rows)} ticks from {recording.path}')
+    deadline = time.perf_counter()
+    for row in rows:
+        reading, events = recording[row]
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        client.commit_tick(reading, reading.ticks * meta['tick_freq'])
+        for wt_id in events.get('add_faults', []):
+            logger.info(f'Fault added to WT[{wt_id}] at tick {reading.ticks}')
+        deadline += period
+    return len(rows)
@@ -0,0 +1,48 @@
+"""Independent random number streams of the simulation. Every environment
+stream, turbine and the array engine get their own generator, derived from a
+single seed with NumPy's `SeedSequence`, so that the values of a stream do
+not depend on how many other streams exist or in which process they run."""
+from __future__ import annotations
+from typing import Optional, Tuple
+import random
+import numpy as np
+
+
+# Spawn keys of the stream families below the root seed
+_ENV, _WTS, _FLEET, _WAVEFORMS, _WIND_FIELD = 0, 1, 2, 3, 4
+# Spawn keys of the environment streams
+ENV_STREAMS = ('temp', 'wind', 'wave', 'vis')
+
+
+class Streams:
+
+    def __init__(self, seed: Optional[int] = None) -> None:
+        self.root = np.random.SeedSequence(seed)
+
+    def child(self, *key: int) -> np.random.SeedSequence:
+        """Same as the `SeedSequence` obtained by repeated `spawn`, but
+        without having to spawn all siblings first."""
+        return np.random.SeedSequence(self.root.entropy,
+                                      spawn_key=self.root.spawn_key + key)
+
+    def rng(self, *key: int) -> random.Random:
+        state = self.child(*key).generate_state(4, np.uint64)
+        return random.Random(int.from_bytes(state.tobytes(), 'little'))
+
+    def env(self, name: str) -> np.random.Generator:
+        return np.random.default_rng(
+                self.child(_ENV, ENV_STREAMS.index(name)))
+
+    def turbine(self, index: int) -> Tuple[random.Random, random.Random]:
+        """Generators of the components and of the faults of a turbine."""
+        return self.rng(_WTS, index, 0), self.rng(_WTS, index, 1)
+
+    def fleet(self) -> np.random.Generator:
+        return np.random.default_rng(self.child(_FLEET))
+
+    def waveforms(self, tick: int) -> np.random.Generator:
+        """Generator of the waveforms of a tick."""
+        return np.random.default_rng(self.child(_WAVEFORMS, tick))
+
+    def wind_field(self) -> np.random.Generator:
+        return np.random.default_rng(self.child(_WIND_FIELD))
@@ -0,0 +1,59 @@
+"""Timing of the real-time simulation loop, see `Simulation.loop`."""
+from __future__ import annotations
+from typing import Dict
+import time
+
+
+# Namespace attribute with the latest `LoopStats.report`
+LOOP_STATS_ATTR = 'datagen_loop_stats'
+# Seconds between reports
+REPORT_INTERVAL = 5.
+PHASES = ('readings', 'callback', 'tick')
+
+
+class LoopStats:
+    """Durations of the phases of the loop and the lag behind the schedule,
+    accumulated between reports."""
+
+    def __init__(self) -> None:
+        self._last_report = time.perf_counter()
+        self.reset()
+
+    def reset(self) -> None:
+        self.ticks = 0
+        self.published = 0
+        self.calls: Dict[str, int] = {phase: 0 for phase in PHASES}
+        self.total: Dict[str, float] = {phase: 0. for phase in PHASES}
+        self.max: Dict[str, float] = {phase: 0. for phase in PHASES}
+        self.lag = 0.
+        self.max_lag = 0.
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.calls[phase] += 1
+        self.total[phase] += seconds
+        self.max[phase] = max(self.max[phase], seconds)
+
+    def set_lag(self, seconds: float) -> None:
+        self.lag = seconds
+        self.max_lag = max(self.max_lag, seconds)
+
+    def due(self) -> bool:
+        return time.perf_counter() - self._last_report >= REPORT_INTERVAL
+
+    def report(self, period: float) -> Dict[str, float]:
+        """Statistics since the last report, durations in milliseconds, and
+        reset them. `period` is the target duration of a tick in seconds."""
+        now = time.perf_counter()
+        elapsed = max(now - self._last_report, 1e-9)
+        report = dict(ticks_per_second=self.ticks / elapsed,
+                      target_ticks_per_second=1 / period,
+                      published_per_second=self.published / elapsed,
+                      lag_ticks=self.lag / period,
+                      max_lag_ticks=self.max_lag / period)
+        for phase in PHASES:
+            report[f'{phase}_ms'] = \
+                1e3 * self.total[phase] / max(self.calls[phase], 1)
+            report[f'{phase}_max_ms'] = 1e3 * self.max[phase]
+        self._last_report = now
+        self.reset()
+        return report
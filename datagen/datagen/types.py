@@ -1,23 +1,33 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
+import heapq
+import os
+import pickle
 import random
 import time
 import logging
 from abc import ABC
 from datetime import timedelta
-from itertools import tee
 from pathlib import Path
-import yaml
-from functools import partial
 from typing import (Protocol, List, Dict, Union, Iterator, Any, Callable, Type,
-                    TypeVar)
+                    TypeVar, ClassVar, Optional, Sequence, Tuple, cast,
+                    TYPE_CHECKING)
+import numpy as np
 
 from .config import Config
-from .utils import Vec2, id_factory, smooth_step
+from .mapgen import iter_turbines, read_models
+from .streams import Streams
+from .timing import LOOP_STATS_ATTR, LoopStats
+from .waveforms import INPUTS, WaveformSpill, Waveforms
+from .utils import FloatArray, Vec2, id_factory
 from .distributions import (make_temp_iter, make_wind_iter, make_wave_iter,
                             make_vis_iter)
 from manager import Client
 
+if TYPE_CHECKING:
+    from .pool import TurbinePool
+    from .windfield import WindField
+
 
 logger = logging.getLogger('datagen')
 
@@ -25,6 +35,13 @@ logger = logging.getLogger('datagen')
 T = TypeVar('T')
 
 P = 1e-8
+# Incremented when the contents of checkpoints change
+CHECKPOINT_VERSION = 5
+# Resolution and range of the power curve lookup tables, in m/s
+LUT_STEP = 0.05
+LUT_MAX = 40.
+# Parameters of the beta distribution of the severity of random faults
+_SEVERITY = (20., 2.)
 
 
 # The `Any`s below should really be `ReadingsT`, but mypy does not support
@@ -35,21 +52,48 @@ ReadingsT = Dict[str, ReadingT]
 
 @dataclass
 class Simulation:
-    client: Client
+    # `None` if the simulation runs without a manager
+    client: Optional[Client]
     cfg: Config = field(repr=False)
     wts: List[WindTurbine]
     env: Environment
     ticks: int = 0
     uptime: timedelta = field(default_factory=timedelta)
     running: bool = True
-
-    def __post_init__(self) -> None:
-        global _client
-        _client = self.client
+    # If set, the turbines are simulated by the array engine and `wts` is
+    # empty, see `Config.engine`
+    fleet: Optional[Fleet] = None
+    # If set, the turbines are simulated by worker processes and `wts` is
+    # empty
+    pool: Optional[TurbinePool] = None
+    # If set, a checkpoint is written to this path every
+    # `checkpoint_interval` ticks, see `save_checkpoint`
+    checkpoint_path: Optional[Path] = None
+    checkpoint_interval: int = 0
+    # Set while a tick is applied, the state is inconsistent if it was
+    # interrupted
+    ticking: bool = False
+    # High-rate waveform channels, if enabled by `Config.waveform_samples`,
+    # and where to spill their raw blocks
+    waveforms: Optional[Waveforms] = None
+    waveform_spill: Optional[WaveformSpill] = None
+    # Wind at each turbine, if enabled by `Config.wind_field`, otherwise all
+    # turbines see the wind of the environment
+    wind_field: Optional[WindField] = None
 
     def get_readings(self) -> ReadingsT:
         # This is what will be written to the central Namespace
-        wt_readings = [wt.get_readings(self.env) for wt in self.wts]
+        if self.fleet is not None:
+            wt_readings = self.fleet.get_readings()
+        elif self.pool is not None:
+            wt_readings = self.pool.get_readings(self.env)
+        else:
+            wt_readings = [wt.get_readings(self.env) for wt in self.wts]
+        if self.waveforms is not None:
+            features = {k: v.tolist()
+                        for k, v in self.waveform_features().items()}
+            for i, wt_reading in enumerate(wt_readings):
+                wt_reading.update((k, v[i]) for k, v in features.items())
         readings: ReadingsT = dict(ticks=self.ticks,
                                    uptime=str(self.uptime),
                                    **self.env.get_readings(),
@@ -59,26 +103,195 @@ class Simulation:
     def tick(self, n: int = 1) -> Simulation:
         for _ in range(n):
             logger.debug(f'Tick {self.ticks}')
+            self.ticking = True
             self.env.tick()
+            winds = None
+            if self.wind_field is not None:
+                self.wind_field.update(self.env.wind)
+                winds = self.wind_field.speeds
+                for wt, mag in zip(self.wts, winds.tolist()):
+                    wt.wind_mag = mag
+            if self.fleet is not None:
+                self._log_faults(self.fleet.tick(self.env, winds))
+            if self.pool is not None:
+                self._log_faults(self.pool.tick(self.env, winds))
             for wt in self.wts:
-                wt.tick(self.env)
+                self._log_faults(wt.tick(self.env))
             self.ticks += 1
             self.uptime += timedelta(seconds=self.cfg.tick_freq)
+            self.ticking = False
+            if (self.checkpoint_path is not None
+                    and self.checkpoint_interval > 0
+                    and self.ticks % self.checkpoint_interval == 0):
+                self.save_checkpoint(self.checkpoint_path)
         return self
 
+    def waveform_features(self) -> Dict[str, FloatArray]:
+        """Features of the waveform channels of the current tick, by reading
+        name. Synthesized once per tick when first needed, so ticks that are
+        not published cost nothing."""
+        assert self.waveforms is not None
+        if self.waveforms.tick != self.ticks:
+            if self.fleet is not None:
+                inputs = self.fleet.waveform_inputs()
+            elif self.pool is not None:
+                inputs = self.pool.waveform_inputs()
+            else:
+                inputs = waveform_inputs(self.wts, self.cfg)
+            self.waveforms.update(self.ticks, inputs, self.waveform_spill)
+        return self.waveforms.features
+
+    def _log_faults(self, msgs: List[str]) -> None:
+        for msg in msgs:
+            logger.info(msg)
+            if self.client is not None:
+                self.client.log(msg, 'warning')
+
+    @property
+    def wt_ids(self) -> List[str]:
+        if self.fleet is not None:
+            return list(self.fleet.ids)
+        if self.pool is not None:
+            return list(self.pool.ids)
+        return [wt.id for wt in self.wts]
+
+    def clear_faults(self, wt_id: str) -> bool:
+        """Remove all faults of a turbine, `False` if it does not exist."""
+        if self.fleet is not None:
+            return self.fleet.clear_faults(wt_id)
+        if self.pool is not None:
+            return self.pool.clear_faults(wt_id)
+        for wt in self.wts:
+            if wt.id == wt_id:
+                wt.faults = []
+                return True
+        return False
+
+    def add_fault(self, wt_id: str, fault_cls: Type[Fault], factor: float
+                  ) -> bool:
+        """Add a fault with the given severity to a turbine, `False` if it
+        does not exist."""
+        if self.fleet is not None:
+            return self.fleet.add_fault(wt_id, fault_cls, factor)
+        if self.pool is not None:
+            return self.pool.add_fault(wt_id, fault_cls, factor)
+        for wt in self.wts:
+            if wt.id == wt_id:
+                wt.add_fault(fault_cls, factor)
+                return True
+        return False
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+        if self.waveform_spill is not None:
+            self.waveform_spill.close()
+
+    def save_checkpoint(self, path: Path) -> None:
+        """Write the state of the simulation to `path`: the environment with
+        its random processes, the turbines with their components, faults and
+        random number generators, and the tick count. The file is replaced
+        atomically."""
+        wts = self.pool.turbines() if self.pool is not None else self.wts
+        state = dict(version=CHECKPOINT_VERSION, cfg=self.cfg, env=self.env,
+                     wts=wts, fleet=self.fleet, waveforms=self.waveforms,
+                     wind_field=self.wind_field, ticks=self.ticks,
+                     uptime=self.uptime)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as fh:
+            pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load_checkpoint(cls, path: Path, client: Optional[Client],
+                        workers: int = 1) -> Simulation:
+        """Restore a simulation saved with `save_checkpoint`, which continues
+        exactly where it stopped. The config is the one of the saved
+        simulation."""
+        with open(path, 'rb') as fh:
+            state = pickle.load(fh)
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f'Unsupported checkpoint version in {path}: '
+                             f'{state.get("version")}')
+        sim = cls(client, state['cfg'], state['wts'], state['env'],
+                  ticks=state['ticks'], uptime=state['uptime'],
+                  fleet=state['fleet'], waveforms=state['waveforms'],
+                  wind_field=state['wind_field'])
+        if workers > 1 and sim.wts:
+            from .pool import TurbinePool
+            sim.pool = TurbinePool(sim.wts, sim.cfg, workers)
+            sim.wts = []
+        return sim
+
     def loop(self, callback: Callable[[ReadingsT], None], max_ticks: int = -1,
              no_wait: bool = False) -> None:
+        """Publish the readings with `callback` and advance the simulation,
+        `_ticks_per_second` times per second. The ticks are scheduled at
+        absolute deadlines, so the time spent in the loop does not slow it
+        down; what happens when it falls behind is set by `_catch_up`. The
+        phase durations and the lag are logged and published to the
+        namespace every `REPORT_INTERVAL` seconds."""
+        if self.cfg._catch_up not in ('batch', 'drop'):
+            raise ValueError(f'Unknown _catch_up: {self.cfg._catch_up}, '
+                             'expected "batch" or "drop"')
         msg = 'Simulation loop started'
         logger.info(msg)
+        stats = LoopStats()
+        deadline = time.perf_counter()
         while self.running and max_ticks != 0:
+            # The config may change while running
+            period = 1 / self.cfg._ticks_per_second
+            start = time.perf_counter()
             readings = self.get_readings()
+            published = time.perf_counter()
+            stats.add('readings', published - start)
             callback(readings)
+            ticked = time.perf_counter()
+            stats.add('callback', ticked - published)
             self.tick()
-            if not no_wait:
-                time.sleep(1 / self.cfg._ticks_per_second)
+            stats.add('tick', time.perf_counter() - ticked)
+            stats.published += 1
+            stats.ticks += 1
             max_ticks -= 1
+            if not no_wait:
+                deadline = self._wait(deadline + period, period, stats)
+            if stats.due():
+                self._report(stats.report(period))
         logger.info('Simulation loop terminated')
 
+    def _wait(self, deadline: float, period: float, stats: LoopStats
+              ) -> float:
+        """Wait for the deadline of the next tick or catch up if behind it,
+        returns the new deadline."""
+        lag = time.perf_counter() - deadline
+        stats.set_lag(max(0., lag))
+        if lag <= 0:
+            time.sleep(-lag)
+            return deadline
+        missed = int(lag / period)
+        if missed > self.cfg._max_lag:
+            logger.warning(f'Simulation loop is {missed} ticks behind, '
+                           'restarting its schedule')
+            return time.perf_counter()
+        if self.cfg._catch_up == 'drop' and missed:
+            # Advance without publishing the ticks in between
+            start = time.perf_counter()
+            self.tick(missed)
+            stats.add('tick', time.perf_counter() - start)
+            stats.ticks += missed
+            return deadline + missed * period
+        # Otherwise run the next tick(s) immediately
+        return deadline
+
+    def _report(self, report: Dict[str, float]) -> None:
+        logger.info('Simulation loop: '
+                    + ', '.join(f'{k}={v:.2f}' for k, v in report.items()))
+        if report['lag_ticks'] >= 1:
+            logger.warning(f'Simulation loop is {report["lag_ticks"]:.1f} '
+                           'ticks behind, reduce _ticks_per_second')
+        if self.client is not None:
+            setattr(self.client.get_ns(), LOOP_STATS_ATTR, report)
+
 
 @dataclass
 class Environment:
@@ -93,17 +306,35 @@ class Environment:
     _vis_iter: Iterator[float] = field(repr=False)
 
     @classmethod
-    def from_config(cls, cfg: Config) -> Environment:
-        wind_iter, wi = tee(make_wind_iter(cfg))
-        wind = next(wind_iter)
-        temp_iter = make_temp_iter(cfg)
-        temp = next(temp_iter)
-        wave_iter = make_wave_iter(cfg, wi)
-        vis_iter = make_vis_iter(cfg)
-        return cls(cfg=cfg, wind=wind, _wind_iter=wind_iter,
-                   _wave_iter=wave_iter, temp=temp, _temp_iter=temp_iter,
-                   wave_mag=next(wave_iter), visibility=next(vis_iter),
-                   _vis_iter=vis_iter)
+    def from_config(cls, cfg: Config, streams: Optional[Streams] = None
+                    ) -> Environment:
+        streams = streams if streams is not None else Streams()
+        wind_iter = make_wind_iter(cfg, streams.env('wind'))
+        temp_iter = make_temp_iter(cfg, streams.env('temp'))
+        vis_iter = make_vis_iter(cfg, streams.env('vis'))
+        env = cls(cfg=cfg, wind=next(wind_iter), _wind_iter=wind_iter,
+                  temp=next(temp_iter), _temp_iter=temp_iter, wave_mag=0.,
+                  _wave_iter=iter(()), visibility=next(vis_iter),
+                  _vis_iter=vis_iter)
+        # The waves follow the current wind, without buffering past values
+        env._wave_iter = make_wave_iter(cfg, _CurrentWind(env),
+                                        streams.env('wave'))
+        env.wave_mag = next(env._wave_iter)
+        return env
+
+    @classmethod
+    def fixed(cls, cfg: Config, state: Tuple[float, ...]) -> Environment:
+        """Environment that does not change, from the `state` of another
+        one. Used by the simulation workers."""
+        angle, mag, temp, wave_mag, visibility = state
+        no_iter: Iterator[Any] = iter(())
+        return cls(cfg, Vec2(angle, mag), temp, wave_mag, visibility,
+                   no_iter, no_iter, no_iter, no_iter)
+
+    @property
+    def state(self) -> Tuple[float, ...]:
+        return (self.wind.angle, self.wind.mag, self.temp, self.wave_mag,
+                self.visibility)
 
     def tick(self) -> None:
         # Update wind
@@ -118,9 +349,20 @@ class Environment:
                     visibility=self.visibility)
 
 
+@dataclass
+class _CurrentWind:
+    env: Environment = field(repr=False)
+
+    def __next__(self) -> Vec2:
+        return self.env.wind
+
+    def __iter__(self) -> Iterator[Vec2]:
+        return self
+
+
 class Component(Protocol):
     @classmethod
-    def factory(cls: Type[T], env: Environment) -> T: ...
+    def factory(cls: Type[T], env: Environment, rng: random.Random) -> T: ...
     def get_readings(self, env: Environment) -> Dict[str, ReadingT]: ...
     def tick(self, wt: WindTurbine,  env: Environment) -> None: ...
 
@@ -128,6 +370,10 @@ class Component(Protocol):
 @dataclass
 class Fault(ABC):
     wt: WindTurbine
+    # The reading that the fault scales after each tick and the name of the
+    # scaling factor, used by the array engine which does not instantiate
+    # faults
+    scales: ClassVar[Tuple[str, str]]
 
     def bofore_tick(self) -> None:
         pass
@@ -146,12 +392,77 @@ class WindTurbineModel:
     cut_in: float  # m/s
     rated: float  # m/s
     rotor_rpm: float  # max Rotations/min
+    rotor_diameter: float = 100.  # m, for the wakes of the wind field
+    # Sampled power curve as [wind speed in m/s, power in watts] pairs, which
+    # is interpolated linearly and zero outside of the samples (i.e. below
+    # cut-in and above cut-out). If not given, the output rises from `cut_in`
+    # to `rated` along a smoothstep (3x^2 - 2x^3) and stays at the capacity
+    # above `rated`.
+    power_curve: Optional[List[Tuple[float, float]]] = field(default=None,
+                                                             repr=False)
+    # Output relative to the capacity every `LUT_STEP` m/s up to `LUT_MAX`,
+    # the last value also applies to higher speeds
+    lut: FloatArray = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        winds = np.arange(0., LUT_MAX + LUT_STEP / 2, LUT_STEP)
+        if self.power_curve is None:
+            x = np.clip((winds - self.cut_in) / (self.rated - self.cut_in),
+                        0., 1.)
+            self.lut = 3 * x**2 - 2 * x**3
+            return
+        curve = np.array(self.power_curve, dtype=np.float64)
+        if curve.ndim != 2 or curve.shape[1] != 2 \
+                or np.any(np.diff(curve[:, 0]) <= 0):
+            raise ValueError(f'Invalid power curve of {self.name}, expected '
+                             '[wind speed, power] pairs by increasing speed')
+        self.lut = np.interp(winds, curve[:, 0], curve[:, 1] / self.capacity,
+                             left=0., right=0.)
+
+    def relative_power(self, wind: float) -> float:
+        """Output relative to the capacity at the given wind speed."""
+        x = min(max(wind / LUT_STEP, 0.), len(self.lut) - 1.)
+        i = min(int(x), len(self.lut) - 2)
+        return float(self.lut[i] + (x - i) * (self.lut[i + 1] - self.lut[i]))
 
 
 # Contains the fault types and their associated probabilities
 _wt_fault_types: Dict[Type[Fault], float] = dict()
 
 
+class FaultClock:
+    """Arrival times of the random faults of a turbine. Every fault type
+    arrives after an exponentially distributed time (the probability of a
+    fault type is its rate per second), kept in a heap, so that a tick only
+    compares the earliest arrival with the current time."""
+
+    def __init__(self, rng: random.Random) -> None:
+        self.rng = rng
+        self.seconds = 0.
+        self._queue: List[Tuple[float, int, Type[Fault]]] = []
+        # Breaks ties in the heap, fault classes are not comparable
+        self._seq = 0
+        for fault_cls in _wt_fault_types:
+            self._schedule(fault_cls)
+
+    def advance(self, seconds: float) -> List[Type[Fault]]:
+        """Advance the time, returns the faults that arrived meanwhile."""
+        self.seconds += seconds
+        due = []
+        while self._queue and self._queue[0][0] <= self.seconds:
+            _, _, fault_cls = heapq.heappop(self._queue)
+            due.append(fault_cls)
+            self._schedule(fault_cls)
+        return due
+
+    def _schedule(self, fault_cls: Type[Fault]) -> None:
+        rate = _wt_fault_types[fault_cls]
+        if rate > 0:
+            arrival = self.seconds + self.rng.expovariate(rate)
+            heapq.heappush(self._queue, (arrival, self._seq, fault_cls))
+            self._seq += 1
+
+
 @dataclass
 class WindTurbine:
     # Components
@@ -163,6 +474,17 @@ class WindTurbine:
     # Faults and others
     faults: List[Fault] = field(default_factory=list)
     id: str = field(default_factory=id_factory('wt'))
+    # Random number generators of the components and of the faults
+    rng: random.Random = field(default_factory=random.Random, repr=False)
+    fault_rng: random.Random = field(default_factory=random.Random,
+                                     repr=False)
+    fault_clock: FaultClock = field(init=False, repr=False)
+    # Wind speed at the turbine if the simulation has a wind field, otherwise
+    # that of the environment applies
+    wind_mag: Optional[float] = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        self.fault_clock = FaultClock(self.fault_rng)
 
     def get_readings(self, env: Environment) -> Dict[str, ReadingT]:
         readings: ReadingsT = dict(
@@ -174,7 +496,8 @@ class WindTurbine:
             readings.update(comp.get_readings(env))
         return readings
 
-    def tick(self, env: Environment) -> None:
+    def tick(self, env: Environment) -> List[str]:
+        """Advance the turbine, returns a message for each new fault."""
         # Call `before_tick` hooks on faults
         for fault in self.faults:
             fault.bofore_tick()
@@ -182,22 +505,34 @@ class WindTurbine:
         for comp in self.components:
             comp.tick(self, env)
         # Potentially add new faults to the wind turbine
-        for fault_cls, prob in _wt_fault_types.items():
-            if random.random() < prob * env.cfg.tick_freq:
-                new_fault = fault_cls(self)
-                msg = f'WT[{self.id}]: New fault {new_fault}'
-                logger.info(msg)
-                _client.log(msg, 'warning')
-                self.faults.append(new_fault)
+        msgs = []
+        for fault_cls in self.fault_clock.advance(env.cfg.tick_freq):
+            new_fault = self.add_fault(
+                    fault_cls, self.fault_rng.betavariate(*_SEVERITY))
+            msgs.append(f'WT[{self.id}]: New fault {new_fault}')
         # Call `after_tick` hooks on faults
         for fault in self.faults:
             fault.after_tick()
+        return msgs
+
+    def add_fault(self, fault_cls: Type[Fault], factor: float) -> Fault:
+        """Add a fault of the given severity."""
+        kwargs = {fault_cls.scales[1]: factor}
+        fault: Fault = cast(Any, fault_cls)(self, **kwargs)
+        self.faults.append(fault)
+        return fault
 
     @classmethod
     def factory(cls, env: Environment, model: WindTurbineModel,
-                id: str) -> WindTurbine:
-        return cls(Tower.factory(env), Rotor.factory(env),
-                   Generator.factory(env), model, id=id)
+                id: str, rngs: Optional[Tuple[random.Random, random.Random]]
+                = None) -> WindTurbine:
+        """`rngs` are the generators of the components and the faults, see
+        `Streams.turbine`."""
+        rng, fault_rng = rngs if rngs is not None \
+            else (random.Random(), random.Random())
+        return cls(Tower.factory(env, rng), Rotor.factory(env, rng),
+                   Generator.factory(env, rng), model, id=id, rng=rng,
+                   fault_rng=fault_rng)
 
     @property
     def components(self) -> List[Component]:
@@ -213,21 +548,23 @@ class WindTurbine:
         return wrapper
 
 
-def wind_turbines_from_config(env: Environment, path: Path
+def wind_turbines_from_config(env: Environment, path: Path,
+                              streams: Optional[Streams] = None
                               ) -> List[WindTurbine]:
-    with open(path) as fh:
-        d = yaml.safe_load(fh)
-    model_ds = d['models']
-    wt_ds = d['turbines']
-    models = {d['name']: WindTurbineModel(**d) for d in model_ds}
+    streams = streams if streams is not None else Streams()
+    return [WindTurbine.factory(env, model=model, id=wt_id,
+                                rngs=streams.turbine(i))
+            for i, (wt_id, model) in enumerate(_turbines_from_config(path))]
+
+
+def _turbines_from_config(path: Path) -> List[Tuple[str, WindTurbineModel]]:
+    models = {d['name']: WindTurbineModel(**d) for d in read_models(path)}
     wts = []
-    for wt_d in wt_ds:
+    for wt_d in iter_turbines(path):
         model_name = wt_d.pop('model')
         if model_name not in models:
             raise ValueError(f'Unknown model in {path}: {model_name}')
-        model = models[model_name]
-        wt = WindTurbine.factory(env, model=model, id=wt_d['id'])
-        wts.append(wt)
+        wts.append((wt_d['id'], models[model_name]))
     return wts
 
 
@@ -236,17 +573,17 @@ class Tower(Component):
     vib_freq: float
 
     @classmethod
-    def factory(cls, env: Environment) -> Tower:
-        vib_freq = random.gauss(env.cfg.tower_vib_freq_mean,
-                                env.cfg.tower_vib_freq_var)
+    def factory(cls, env: Environment, rng: random.Random) -> Tower:
+        vib_freq = rng.gauss(env.cfg.tower_vib_freq_mean,
+                             env.cfg.tower_vib_freq_var)
         vib_freq = max(0, vib_freq)
         return cls(vib_freq=vib_freq)
 
     def get_readings(self, _: Environment) -> Dict[str, ReadingT]:
         return dict(tower_vib_freq=self.vib_freq)
 
-    def tick(self, _: WindTurbine, env: Environment) -> None:
-        vib_freq = random.gauss(env.cfg.tower_vib_freq_mean,
+    def tick(self, wt: WindTurbine, env: Environment) -> None:
+        vib_freq = wt.rng.gauss(env.cfg.tower_vib_freq_mean,
                                 env.cfg.tower_vib_freq_var)
         self.vib_freq = max(0, vib_freq)
 
@@ -256,27 +593,26 @@ class Rotor(Component):
     rps: float
 
     @classmethod
-    def factory(cls, _: Environment) -> Rotor:
+    def factory(cls, _: Environment, __: random.Random) -> Rotor:
         return cls(rps=0.)
 
     def get_readings(self, _: Environment) -> Dict[str, ReadingT]:
         return dict(rotor_rps=self.rps)
 
     def tick(self, wt: WindTurbine, env: Environment) -> None:
-        rps = smooth_step(env.wind.mag,
-                          offset=wt.model.cut_in,
-                          width=wt.model.rated - wt.model.cut_in)
+        rps = wt.model.relative_power(env.wind.mag if wt.wind_mag is None
+                                      else wt.wind_mag)
         rps *= wt.model.rotor_rpm / env.cfg.ticks_per_minute
-        rps = rps * random.gauss(1., env.cfg.rotor_rps_relative_var)
+        rps = rps * wt.rng.gauss(1., env.cfg.rotor_rps_relative_var)
         self.rps = max(0, rps)
 
 
 @WindTurbine.wt_fault(P)
 @dataclass
 class RotorBladeSurfaceCrack(Fault):
+    scales = ('rotor_rps', 'rps_factor')
     # Severety of the fault
-    rps_factor: float = field(default_factory=partial(
-                              random.betavariate, 20, 2))
+    rps_factor: float
 
     def after_tick(self) -> None:
         self.wt.rotor.rps *= self.rps_factor
@@ -291,7 +627,7 @@ class Generator(Component):
     power: float
 
     @classmethod
-    def factory(cls, env: Environment) -> Generator:
+    def factory(cls, env: Environment, _: random.Random) -> Generator:
         temp = env.temp
         return cls(temp=temp, power=0.)
 
@@ -300,7 +636,7 @@ class Generator(Component):
 
     def tick(self, wt: WindTurbine, env: Environment) -> None:
         # Update temp
-        temp_d = random.normalvariate(env.cfg.gen_temp_diff_mean,
+        temp_d = wt.rng.normalvariate(env.cfg.gen_temp_diff_mean,
                                       env.cfg.gen_temp_diff_var)
         self.temp = env.temp + temp_d
         # Update power
@@ -312,9 +648,9 @@ class Generator(Component):
 @WindTurbine.wt_fault(P)
 @dataclass
 class GeneratorDamage(Fault):
+    scales = ('power', 'power_factor')
     # Severety of the fault
-    power_factor: float = field(default_factory=partial(
-                                random.betavariate, 20, 2))
+    power_factor: float
 
     def after_tick(self) -> None:
         self.wt.generator.power *= self.power_factor
@@ -322,3 +658,191 @@ class GeneratorDamage(Fault):
     def __str__(self) -> str:
         return (f'{self.__class__.__name__}[power_factor='
                 f'{self.power_factor:0.5}]')
+
+
+def waveform_inputs(wts: Sequence[WindTurbine], cfg: Config
+                    ) -> Dict[str, FloatArray]:
+    """The `waveforms.INPUTS` of the turbines."""
+    factors = {reading: [1.] * len(wts) for reading in ('rotor_rps', 'power')}
+    for i, wt in enumerate(wts):
+        for fault in wt.faults:
+            reading, factor_name = fault.scales
+            factors[reading][i] *= getattr(fault, factor_name)
+    max_rps = np.array([wt.model.rotor_rpm / cfg.ticks_per_minute
+                        for wt in wts])
+    capacity = np.array([wt.model.capacity for wt in wts])
+    inputs = dict(
+        vib_freq=np.array([wt.tower.vib_freq for wt in wts]),
+        load=np.array([wt.rotor.rps for wt in wts]) / max_rps,
+        power=np.array([wt.generator.power for wt in wts]) / capacity,
+        rotor_fault=1 - np.array(factors['rotor_rps']),
+        power_fault=1 - np.array(factors['power']))
+    assert tuple(inputs) == INPUTS
+    return inputs
+
+
+class Fleet:
+    """Array engine: the state of all wind turbines as struct-of-arrays, which
+    is advanced for the whole fleet at once. Produces the same readings as
+    the `WindTurbine` objects (but not the same random numbers), faults are
+    kept as per-turbine factors on the readings they scale."""
+
+    def __init__(self, cfg: Config, ids: List[str],
+                 models: List[WindTurbineModel], model_index: List[int],
+                 env: Environment, rng: np.random.Generator) -> None:
+        self.cfg = cfg
+        self.ids = ids
+        self.models = models
+        self._index = {wt_id: i for i, wt_id in enumerate(ids)}
+        self.model_index = np.array(model_index, dtype=np.intp)
+        self.model_names = [models[i].name for i in model_index]
+        # Per-model parameters, gathered per turbine
+        self.capacity = self._per_model([m.capacity for m in models])
+        # Power curves of the models, see `WindTurbineModel.lut`
+        self.luts = np.stack([m.lut for m in models])
+        self.rotor_rpm = self._per_model([m.rotor_rpm for m in models])
+        self.rng = rng
+        n = len(ids)
+        self.vib_freq = np.maximum(0., self.rng.normal(
+                cfg.tower_vib_freq_mean, cfg.tower_vib_freq_var, n))
+        self.rps = np.zeros(n)
+        self.temp = np.full(n, env.temp)
+        self.power = np.zeros(n)
+        # Product of the factors of the faults, by the reading they scale
+        self.factors = {reading: np.ones(n)
+                        for reading, _ in (fault_cls.scales
+                                           for fault_cls in _wt_fault_types)}
+        self.faults: List[List[str]] = [[] for _ in ids]
+        # Faults of the whole fleet arrive as a single Poisson process, whose
+        # events are assigned to a random turbine and fault type
+        self.fault_types = list(_wt_fault_types)
+        rates = np.array(list(_wt_fault_types.values()), dtype=np.float64)
+        self.fault_rate = float(rates.sum()) * n
+        self.fault_p = rates / max(rates.sum(), 1e-300)
+        self.seconds = 0.
+        self.next_fault = self._fault_interval()
+
+    @classmethod
+    def from_config(cls, env: Environment, path: Path,
+                    streams: Optional[Streams] = None) -> Fleet:
+        ids: List[str] = []
+        models: List[WindTurbineModel] = []
+        model_index: List[int] = []
+        indices: Dict[str, int] = {}
+        for wt_id, model in _turbines_from_config(path):
+            if model.name not in indices:
+                indices[model.name] = len(models)
+                models.append(model)
+            ids.append(wt_id)
+            model_index.append(indices[model.name])
+        streams = streams if streams is not None else Streams()
+        return cls(env.cfg, ids, models, model_index, env, streams.fleet())
+
+    def _per_model(self, values: List[float]) -> FloatArray:
+        return np.array(values, dtype=np.float64)[self.model_index]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def tick(self, env: Environment, winds: Optional[FloatArray] = None
+             ) -> List[str]:
+        """Advance all turbines, returns a message for each new fault.
+        `winds` are the wind speeds at the turbines, if not that of the
+        environment."""
+        # Same order as `WindTurbine.components`
+        cfg, n = self.cfg, len(self)
+        max_rps = self.rotor_rpm / cfg.ticks_per_minute
+        # Generator, using the rotor speed of the last tick
+        self.temp = env.temp + self.rng.normal(cfg.gen_temp_diff_mean,
+                                               cfg.gen_temp_diff_var, n)
+        self.power = self.capacity * self.rps / max_rps
+        # Tower
+        self.vib_freq = np.maximum(0., self.rng.normal(
+                cfg.tower_vib_freq_mean, cfg.tower_vib_freq_var, n))
+        # Rotor
+        if winds is None:
+            winds = np.full(n, env.wind.mag)
+        rps = self.relative_power(winds) * max_rps
+        rps *= self.rng.normal(1., cfg.rotor_rps_relative_var, n)
+        self.rps = np.maximum(0., rps)
+        # New faults, then all faults scale their readings
+        msgs = []
+        self.seconds += cfg.tick_freq
+        while self.next_fault <= self.seconds:
+            i = int(self.rng.integers(n))
+            fault_cls = self.fault_types[
+                    int(self.rng.choice(len(self.fault_types),
+                                        p=self.fault_p))]
+            severity = float(self.rng.beta(*_SEVERITY))
+            msgs.append(self._add_fault(i, fault_cls, severity))
+            self.next_fault += self._fault_interval()
+        self.rps *= self.factors['rotor_rps']
+        self.power *= self.factors['power']
+        return msgs
+
+    def _fault_interval(self) -> float:
+        if self.fault_rate <= 0:
+            return float('inf')
+        return float(self.rng.exponential(1 / self.fault_rate))
+
+    def relative_power(self, wind: FloatArray) -> FloatArray:
+        """Output relative to the capacity of each turbine at the given wind
+        speeds, interpolated in the lookup table of its model."""
+        x = np.clip(wind / LUT_STEP, 0., self.luts.shape[1] - 1)
+        i = np.minimum(x.astype(np.intp), self.luts.shape[1] - 2)
+        low = self.luts[self.model_index, i]
+        high = self.luts[self.model_index, i + 1]
+        power: FloatArray = low + (x - i) * (high - low)
+        return power
+
+    def waveform_inputs(self) -> Dict[str, FloatArray]:
+        """The `waveforms.INPUTS` of the turbines."""
+        max_rps = self.rotor_rpm / self.cfg.ticks_per_minute
+        return dict(vib_freq=self.vib_freq, load=self.rps / max_rps,
+                    power=self.power / self.capacity,
+                    rotor_fault=1 - self.factors['rotor_rps'],
+                    power_fault=1 - self.factors['power'])
+
+    def values(self, fields: Sequence[str],
+               extra: Optional[Dict[str, FloatArray]] = None) -> FloatArray:
+        """Current readings of shape [turbines, fields], `extra` are
+        additional readings by name."""
+        columns = dict(generator_temp=self.temp, power=self.power,
+                       tower_vib_freq=self.vib_freq, rotor_rps=self.rps,
+                       **(extra or {}))
+        return np.stack([columns[f] for f in fields], axis=-1)
+
+    def get_readings(self) -> List[Dict[str, ReadingT]]:
+        return [dict(wt_id=wt_id, model_name=model_name, _faults=list(faults),
+                     generator_temp=temp, power=power, tower_vib_freq=vib,
+                     rotor_rps=rps)
+                for wt_id, model_name, faults, temp, power, vib, rps in zip(
+                    self.ids, self.model_names, self.faults,
+                    self.temp.tolist(), self.power.tolist(),
+                    self.vib_freq.tolist(), self.rps.tolist())]
+
+    def clear_faults(self, wt_id: str) -> bool:
+        i = self._index.get(wt_id)
+        if i is None:
+            return False
+        self.faults[i] = []
+        for factors in self.factors.values():
+            factors[i] = 1.
+        return True
+
+    def add_fault(self, wt_id: str, fault_cls: Type[Fault], factor: float
+                  ) -> bool:
+        i = self._index.get(wt_id)
+        if i is None:
+            return False
+        self._add_fault(i, fault_cls, factor)
+        return True
+
+    def _add_fault(self, i: int, fault_cls: Type[Fault], factor: float
+                   ) -> str:
+        reading, factor_name = fault_cls.scales
+        self.factors[reading][i] *= factor
+        # Same as `str` of the fault object
+        self.faults[i].append(f'{fault_cls.__name__}[{factor_name}='
+                              f'{factor:0.5}]')
+        return f'WT[{self.ids[i]}]: New fault {self.faults[i][-1]}'
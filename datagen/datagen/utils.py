@@ -3,11 +3,18 @@ import random
 import math
 from itertools import tee, islice
 from dataclasses import dataclass
-from typing import Callable, Iterator, Iterable, TypeVar, Tuple, Optional
+from typing import Callable, Iterator, TypeVar, Tuple
 from sqlitedict import SqliteDict # type: ignore
+import numpy as np
+import numpy.typing as npt
 
 
 T = TypeVar('T')
+FloatArray = npt.NDArray[np.float64]
+# Number of values generated at once by the block streams
+BLOCK_TICKS = 4096
+# Mean radius of the earth in metres
+EARTH_RADIUS = 6.371e6
 
 
 def is_idle_device(device: str) -> bool:
@@ -50,11 +57,6 @@ def sliding_window(it: Iterator[T], n: int = 2) -> Iterator[Tuple[T, ...]]:
                  for offset, it in enumerate(tee(it, n))))
 
 
-def isum(acc: T, *its: Iterable[T]) -> Iterator[T]:
-    for values in zip(*its):
-        yield sum(values, acc)
-
-
 _NEXT_IDS = dict()
 
 
@@ -71,38 +73,72 @@ def id_factory(namespace: str) -> Callable[[], str]:
     return factory
 
 
-class Autocorr:
-
-    def __init__(self, dist: Callable[[float], float], alpha: float = 2.,
-                 beta: float = 20., offset: float = 0, increment: float = 1.,
-                 init: Optional[float] = None) -> None:
+def linear_recurrence(c: FloatArray, b: FloatArray, x0: float,
+                      max_decay: float = 500.) -> FloatArray:
+    """Solves `x[t] = c[t] * x[t - 1] + b[t]` with `x[-1] = x0` for all `t`
+    at once, for `0 <= c <= 1`. Uses the closed form
+    `x[t] = P[t] * (x0 + sum(b[k] / P[k] for k <= t))` with `P` the cumulative
+    product of `c`, on segments short enough that `P` does not underflow."""
+    x = np.empty_like(b)
+    decay = np.cumsum(-np.log(np.maximum(c, np.finfo(np.float64).tiny)))
+    start, base = 0, 0.
+    while start < len(b):
+        # Decay relative to the start of the segment is non-decreasing
+        stop = int(np.searchsorted(decay, base + max_decay, side='right'))
+        if stop == start:
+            # A single (near) zero factor
+            x[start] = c[start] * x0 + b[start]
+            stop = start + 1
+        else:
+            p = np.exp(base - decay[start:stop])
+            x[start:stop] = p * (x0 + np.cumsum(b[start:stop] / p))
+        x0, base = x[stop - 1], decay[stop - 1]
+        start = stop
+    return x
+
+
+class BlockAutocorr:
+    """Autocorrelated values: each one mixes `dist` at the next offset with
+    the previous value, weighted by a Beta(`alpha`, `beta`) draw. Generates
+    `block` values at once with `dist` evaluated on an array of offsets."""
+
+    def __init__(self, dist: Callable[[FloatArray], FloatArray],
+                 rng: np.random.Generator, alpha: float = 2.,
+                 beta: float = 20., offset: float = 0,
+                 increment: float = 1., block: int = BLOCK_TICKS) -> None:
         self.dist = dist
+        self.rng = rng
         self.alpha = alpha
         self.beta = beta
         self.offset = offset
         self.increment = increment
-        if init is None:
-            self.residual = dist(self.offset)
-            self.offset += self.increment
-        else:
-            self.residual = init
-
-    def __next__(self) -> float:
-        a = random.betavariate(self.alpha, self.beta)
-        x = self.dist(self.offset) * a + (1 - a) * self.residual
-        self.residual = x
+        self.block = block
+        self.residual = float(dist(np.array([self.offset]))[0])
         self.offset += self.increment
+
+    def next_block(self) -> FloatArray:
+        n = self.block
+        offsets = self.offset + self.increment * np.arange(n)
+        a = self.rng.beta(self.alpha, self.beta, n)
+        x = linear_recurrence(1 - a, a * self.dist(offsets), self.residual)
+        self.residual = float(x[-1])
+        self.offset += n * self.increment
         return x
 
-    def __iter__(self) -> Iterator[float]:
-        return self
 
+class Blocks:
+    """Iterator over the values of the arrays returned by `next_block`."""
 
-def smooth_step(x: float, offset: float = 0., width: float = 1.) -> float:
-    """https://en.wikipedia.org/wiki/Smoothstep"""
-    if x < offset:
-        return 0.
-    if x > offset + width:
-        return 1.
-    x = (x - offset) / width
-    return 3 * x**2 - 2 * x**3
+    def __init__(self, next_block: Callable[[], FloatArray]) -> None:
+        self.next_block = next_block
+        self._values: Iterator[float] = iter(())
+
+    def __next__(self) -> float:
+        try:
+            return next(self._values)
+        except StopIteration:
+            self._values = iter(self.next_block().tolist())
+            return next(self._values)
+
+    def __iter__(self) -> Iterator[float]:
+        return self
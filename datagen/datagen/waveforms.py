@@ -0,0 +1,175 @@
+"""High-rate waveform channels of the turbines. Every tick, a block of
+`waveform_samples` samples at `waveform_rate` Hz is synthesized per turbine
+and channel, and reduced to compact features that are published with the
+readings: the RMS and the energies of `waveform_bands` logarithmically spaced
+frequency bands up to the Nyquist frequency, which sum to the squared RMS (as
+in octave-band analysis, so that both the low harmonics of the generator
+current and the tower modes at kHz are resolved). The raw
+blocks can additionally be spilled to memory-mapped files, see
+`WaveformSpill`."""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import json
+import math
+import numpy as np
+import numpy.typing as npt
+
+from .config import Config
+from .streams import Streams
+from .utils import FloatArray
+
+
+CHANNELS = ('tower_vib', 'generator_current')
+# Per-turbine arrays the waveforms are synthesized from: the frequency of
+# the tower vibration in Hz, the rotor speed and power relative to their
+# maximum, and the severity (1 - product of the factors) of the faults that
+# scale the rotor speed and the power.
+INPUTS = ('vib_freq', 'load', 'power', 'rotor_fault', 'power_fault')
+# Frequency of the grid, and thus of the generator current, in Hz
+GRID_FREQ = 50.
+# Number of turbines synthesized at once, bounds the memory use
+_CHUNK = 256
+
+
+def feature_names(cfg: Config) -> List[str]:
+    return [f'{channel}_{feature}' for channel in CHANNELS
+            for feature in ['rms'] + [f'band{i}'
+                                      for i in range(cfg.waveform_bands)]]
+
+
+def band_features(blocks: FloatArray, bands: int) -> FloatArray:
+    """Reduce blocks of shape [..., samples] to [..., 1 + bands]: the RMS and
+    the energy in each band."""
+    n = blocks.shape[-1]
+    power = np.abs(np.fft.rfft(blocks, axis=-1))**2 / n**2
+    # One-sided spectrum, so that the energies sum to the mean square
+    power[..., 1:(n + 1) // 2] *= 2
+    energies = np.add.reduceat(power, band_edges(power.shape[-1], bands),
+                               axis=-1)
+    rms = np.sqrt(np.mean(blocks**2, axis=-1, keepdims=True))
+    features: FloatArray = np.concatenate([rms, energies], axis=-1)
+    return features
+
+
+def band_edges(bins: int, bands: int) -> npt.NDArray[np.intp]:
+    """First frequency bin of each band, logarithmically spaced from the
+    first non-zero frequency on, the first band includes the DC bin."""
+    edges = np.geomspace(1, bins, bands + 1)[:-1].astype(np.intp)
+    edges[0] = 0
+    # Every band has at least one bin
+    edges = np.maximum(edges, np.arange(bands))
+    return np.minimum(edges, bins - 1)
+
+
+class Waveforms:
+    """Synthesizes the waveform blocks of all turbines and keeps the
+    features of the latest tick. The blocks of a tick are drawn from a
+    generator seeded with the tick, so that they only depend on the seed and
+    not on which ticks were published before."""
+
+    def __init__(self, cfg: Config, streams: Streams) -> None:
+        self.cfg = cfg
+        self.streams = streams
+        self.names = feature_names(cfg)
+        # Tick of `features`
+        self.tick = -1
+        self.features: Dict[str, FloatArray] = {}
+
+    def update(self, tick: int, inputs: Dict[str, FloatArray],
+               spill: Optional[WaveformSpill] = None) -> None:
+        n = len(inputs['load'])
+        features = np.zeros((n, len(self.names)))
+        rng = self.streams.waveforms(tick)
+        for start in range(0, n, _CHUNK):
+            chunk = {k: v[start:start + _CHUNK] for k, v in inputs.items()}
+            blocks = self.synthesize(chunk, rng)
+            features[start:start + _CHUNK] = np.concatenate(
+                    [band_features(blocks[channel], self.cfg.waveform_bands)
+                     for channel in CHANNELS], axis=-1)
+            if spill is not None:
+                spill.write(tick, start, blocks)
+        self.features = {name: features[:, i]
+                         for i, name in enumerate(self.names)}
+        self.tick = tick
+
+    def synthesize(self, inputs: Dict[str, FloatArray],
+                   rng: np.random.Generator) -> Dict[str, FloatArray]:
+        """Waveform blocks of shape [turbines, samples] by channel."""
+        cfg = self.cfg
+        n, samples = len(inputs['load']), cfg.waveform_samples
+        t = np.arange(samples) / cfg.waveform_rate
+        # Random phases, the blocks of consecutive ticks are not contiguous
+        phase = rng.random((2, n, 1)) * 2 * math.pi
+        # Tower: its vibration mode, excited by the rotor, and a harmonic
+        # and broadband noise from damaged blades. Harmonics are computed
+        # with trigonometric identities, for the faulty turbines only.
+        theta = 2 * math.pi * inputs['vib_freq'][:, None] * t + phase[0]
+        sin = np.sin(theta)
+        tower = (0.1 + inputs['load'][:, None]) * sin
+        rotor_fault = inputs['rotor_fault'][:, None]
+        faulty = np.flatnonzero(rotor_fault)
+        tower[faulty] += (rotor_fault[faulty] * sin[faulty]
+                          * np.cos(theta[faulty]))
+        tower += rng.standard_normal((n, samples)) * (0.05 + 0.3 * rotor_fault)
+        # Generator: the grid frequency, the same for all turbines up to the
+        # phase, with odd harmonics from damage
+        grid = 2 * math.pi * GRID_FREQ * t
+        sin = np.cos(phase[1]) * np.sin(grid) + np.sin(phase[1]) * np.cos(grid)
+        current = inputs['power'][:, None] * sin
+        power_fault = inputs['power_fault'][:, None]
+        faulty = np.flatnonzero(power_fault)
+        sin, sin2 = sin[faulty], sin[faulty]**2
+        # 0.3 sin(3x) + 0.2 sin(5x)
+        current[faulty] += power_fault[faulty] * sin * (
+                0.3 * (3 - 4 * sin2) + 0.2 * (5 - 20 * sin2 + 16 * sin2**2))
+        current += rng.normal(0., 0.02, (n, samples))
+        return dict(tower_vib=tower, generator_current=current)
+
+
+class WaveformSpill:
+    """Raw waveform blocks of the latest `capacity` ticks, in memory-mapped
+    files in `out`:
+
+        out/meta.json               turbine ids, channels, rate, capacity
+        out/ticks.npy               [capacity], tick of each row, -1 if empty
+        out/<channel>.npy           [capacity, turbines, samples], float32
+
+    Tick `t` is in row `t % capacity`."""
+
+    def __init__(self, out: Path, cfg: Config, wt_ids: Sequence[str],
+                 capacity: int) -> None:
+        self.capacity = capacity
+        out.mkdir(parents=True, exist_ok=True)
+        with open(out / 'meta.json', 'w') as fh:
+            json.dump(dict(wt_ids=list(wt_ids), channels=list(CHANNELS),
+                           rate=cfg.waveform_rate,
+                           samples=cfg.waveform_samples,
+                           capacity=capacity), fh)
+        self.ticks: npt.NDArray[np.int64] = np.lib.format.open_memmap(
+                out / 'ticks.npy', mode='w+', dtype=np.int64,
+                shape=(capacity,))  # type: ignore
+        self.ticks[:] = -1
+        self.blocks: Dict[str, npt.NDArray[np.float32]] = {
+                channel: np.lib.format.open_memmap(  # type: ignore
+                    out / f'{channel}.npy', mode='w+', dtype=np.float32,
+                    shape=(capacity, len(wt_ids), cfg.waveform_samples))
+                for channel in CHANNELS}
+
+    def write(self, tick: int, start: int, blocks: Dict[str, FloatArray]
+              ) -> None:
+        """Write the blocks of the turbines from index `start` on."""
+        row = tick % self.capacity
+        # Mark the row as being written until the last turbine is
+        self.ticks[row] = -1
+        stop = start
+        for channel, values in blocks.items():
+            stop = start + len(values)
+            self.blocks[channel][row, start:stop] = values
+        if stop == self.blocks[CHANNELS[0]].shape[1]:
+            self.ticks[row] = tick
+
+    def close(self) -> None:
+        for array in (self.ticks, *self.blocks.values()):
+            if isinstance(array, np.memmap):
+                array.flush()
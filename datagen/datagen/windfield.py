@@ -0,0 +1,142 @@
+"""Spatially resolved wind at the turbine positions of the map. The wind of
+the `Environment` is the free-stream wind, which varies over the map with a
+frozen random field that drifts with the wind, and is slowed down in the
+wakes of upstream turbines (Jensen's model, with the deficits of several
+wakes combined as root-sum-square). The wakes only depend on the wind
+direction, so the pairs of turbines in each other's wake are computed once
+per direction bin and the resulting slow-down of each turbine is cached."""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Tuple
+import math
+import numpy as np
+import numpy.typing as npt
+
+from .config import Config
+from .mapgen import iter_turbines, read_models
+from .utils import EARTH_RADIUS, FloatArray, Vec2
+
+
+# Number of plane waves of the random field
+_WAVES = 16
+# Maximum displacement of the field per tick, relative to
+# `wind_field_scale`. With hourly ticks the wind would carry the field
+# further than its scale in every tick, so it would not be correlated
+# between ticks; the field moves more slowly than the wind instead
+_MAX_DRIFT = 0.1
+# Wakes whose coefficient is lower are ignored
+_MIN_COEFF = 1e-3
+# Number of downstream turbines whose wakes are computed at once
+_CHUNK = 512
+
+_Wakes = Tuple[npt.NDArray[np.intp], npt.NDArray[np.intp], FloatArray]
+
+
+def project(lat_lng: FloatArray) -> FloatArray:
+    """Positions in metres east and north of the centre, from [lat, lng]
+    pairs in degrees (equirectangular, which is accurate enough for the
+    size of a wind farm)."""
+    if not len(lat_lng):
+        return np.zeros((0, 2))
+    lat, lng = np.radians(lat_lng).T
+    lat0 = lat.mean()
+    xy: FloatArray = np.stack([(lng - lng.mean()) * math.cos(lat0),
+                               lat - lat0], axis=-1) * EARTH_RADIUS
+    return xy
+
+
+class WindField:
+
+    def __init__(self, cfg: Config, positions: FloatArray,
+                 rotor_diameters: FloatArray, rng: np.random.Generator
+                 ) -> None:
+        self.cfg = cfg
+        self.positions = positions
+        self.radii = rotor_diameters / 2
+        self.bin_width = 2 * math.pi / cfg.wind_field_bins
+        # Factor of the wind speed at each turbine by direction bin
+        self._cache: Dict[int, FloatArray] = {}
+        # Random plane waves with wavelengths around `wind_field_scale`
+        k = 2 * math.pi / cfg.wind_field_scale * rng.uniform(0.5, 2., _WAVES)
+        angle = rng.uniform(0., 2 * math.pi, _WAVES)
+        self._wave_vectors = np.stack([k * np.cos(angle), k * np.sin(angle)])
+        self._phases = rng.uniform(0., 2 * math.pi, _WAVES)
+        # Displacement of the frozen field by the wind so far, in metres
+        self.drift = np.zeros(2)
+        # Wind speed at the turbines, updated by `update`
+        self.speeds = np.zeros(len(positions))
+
+    @classmethod
+    def from_config(cls, cfg: Config, path: Path, rng: np.random.Generator
+                    ) -> WindField:
+        diameters = {m['name']: m.get('rotor_diameter', 100.)
+                     for m in read_models(path)}
+        lat_lng, wt_diameters = [], []
+        try:
+            for wt in iter_turbines(path):
+                lat_lng.append([wt['lat'], wt['lng']])
+                wt_diameters.append(diameters[wt['model']])
+        except KeyError as e:
+            raise ValueError(f'The wind field needs the lat and lng of all '
+                             f'turbines in {path}') from e
+        return cls(cfg, project(np.array(lat_lng, dtype=np.float64)
+                                .reshape(-1, 2)),
+                   np.array(wt_diameters, dtype=np.float64), rng)
+
+    def update(self, wind: Vec2) -> None:
+        """Evaluate the field for the free-stream wind of the current
+        tick."""
+        cfg = self.cfg
+        direction = np.array([math.cos(wind.angle), math.sin(wind.angle)])
+        self.drift += direction * min(wind.mag * cfg.tick_freq,
+                                      _MAX_DRIFT * cfg.wind_field_scale)
+        phase = (self.positions - self.drift) @ self._wave_vectors \
+            + self._phases
+        # Unit variance sum of the waves
+        waves = np.cos(phase) * math.sqrt(2 / _WAVES)
+        speeds = wind.mag * np.maximum(
+                0., 1 + cfg.wind_field_std * waves.sum(axis=1))
+        self.speeds = speeds * self.wake_factors(wind.angle)
+
+    def wake_factors(self, angle: float) -> FloatArray:
+        """Factor of the wind speed at each turbine due to the wakes of the
+        others, for the direction bin of `angle`."""
+        key = int(round(angle / self.bin_width)) % self.cfg.wind_field_bins
+        if key not in self._cache:
+            downstream, _, coeff = self.wakes(key * self.bin_width)
+            deficit = np.sqrt(np.bincount(downstream, weights=coeff**2,
+                                          minlength=len(self.positions)))
+            # Deficit of a single wake right behind the rotor
+            thrust = 1 - math.sqrt(1 - self.cfg.wake_thrust)
+            self._cache[key] = np.maximum(0., 1 - thrust * deficit)
+        return self._cache[key]
+
+    def wakes(self, angle: float) -> _Wakes:
+        """Pairs of turbines where the first is in the wake of the second,
+        and the coefficients `(r / (r + k * distance))**2` of the wakes, for
+        wind blowing towards `angle`."""
+        # Coordinates along and across the direction the wind blows to, i.e.
+        # the angle of `Vec2`, counter-clockwise from east
+        along = self.positions @ np.array([math.cos(angle), math.sin(angle)])
+        across = self.positions @ np.array([-math.sin(angle),
+                                            math.cos(angle)])
+        k = self.cfg.wake_decay
+        if not len(along):
+            # A map without turbines
+            return (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp),
+                    np.zeros(0))
+        pairs: List[_Wakes] = []
+        for start in range(0, len(along), _CHUNK):
+            stop = start + _CHUNK
+            # [downstream, upstream]
+            distance = along[start:stop, None] - along[None, :]
+            offset = np.abs(across[start:stop, None] - across[None, :])
+            wake_radius = self.radii[None, :] + k * distance
+            coeff = (self.radii[None, :] / np.maximum(wake_radius, 1e-9))**2
+            hit = (distance > 0) & (offset < wake_radius) \
+                & (coeff >= _MIN_COEFF)
+            down, up = np.nonzero(hit)
+            pairs.append((down + start, up, coeff[down, up]))
+        return (np.concatenate([p[0] for p in pairs]),
+                np.concatenate([p[1] for p in pairs]),
+                np.concatenate([p[2] for p in pairs]))
@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import time
 from typing import Any, Dict, List
 from argparse import ArgumentParser
 from logging import getLogger
@@ -27,11 +26,11 @@ def main() -> None:
 
 
 def get_attr(client: manager.Client, attr: str) -> Any:
-    while True:
-        ns = client.get_ns()
-        if hasattr(ns, attr):
-            return getattr(ns, attr)
-        time.sleep(0.1)  # lmao
+    # Blocks until the attribute has been set by another service
+    changed = client.wait_for(attr)
+    assert changed is not None
+    _, value = changed
+    return value
 
 
 if __name__ == '__main__':
@@ -194,13 +194,8 @@ def loop(client: Client, drones: List[Drone]) -> None:
                     msg = f'{drone} reached station'
                     logger.info(msg)
                     client.log(msg)
-        # Carry over previously finished inspections
-        ns = client.get_ns()
-        if not hasattr(ns, 'finished_inspections'):
-            ns.finished_inspections = []
-        prev: List[str] = ns.finished_inspections
-        prev.extend(finished_inspections)
-        ns.finished_inspections = prev
+        # Hand the finished inspections to the simulation, which drains them
+        client.get_ns().extend('finished_inspections', finished_inspections)
         time.sleep(TIME_DELTA)
         client.get_ns().drone_positions = [{'drone_id': d.id,
                                             'lat': d.pos.x,
@@ -212,8 +207,8 @@ def loop(client: Client, drones: List[Drone]) -> None:
 
 
 def get_attr(client: Client, attr: str) -> Any:
-    while True:
-        ns = client.get_ns()
-        if hasattr(ns, attr):
-            return getattr(ns, attr)
-        time.sleep(0.1)  # lmao
+    # Blocks until the attribute has been set by another service
+    changed = client.wait_for(attr)
+    assert changed is not None
+    _, value = changed
+    return value
@@ -1,22 +1,68 @@
 #!/usr/bin/env python3
+from typing import Optional
 import argparse
 import logging
+import multiprocessing
+import yaml
 
 import manager
+from manager.shards import ShardMap
+from manager.stats import format_stats
 
 
 logger = logging.getLogger('manager')
 
 
+def _run_shard(host: str, port: int, authkey: bytes, shards: ShardMap
+               ) -> None:
+    manager.Server(host, port, authkey, shards).run()
+
+
+def _start_shards(args: argparse.Namespace) -> Optional[ShardMap]:
+    """Start the servers of all but the first shard in child processes."""
+    if args.shards <= 1:
+        return None
+    static = None
+    if args.shard_map is not None:
+        with open(args.shard_map) as fh:
+            static = yaml.safe_load(fh)
+    ports = [args.manager_port + i for i in range(args.shards)]
+    shards = ShardMap(ports, static)
+    for port in ports[1:]:
+        process = multiprocessing.Process(
+                target=_run_shard, daemon=True,
+                args=(args.manager_host, port, args.manager_authkey, shards))
+        process.start()
+    logger.info(f'Started {args.shards} shards on ports {ports[0]}-'
+                f'{ports[-1]}')
+    return shards
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     manager.common.add_logging_args(parser)
     manager.add_manager_arguments(parser)
+    parser.add_argument('--stats', action='store_true',
+                        help='Print the call statistics of a running manager '
+                        'and exit')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='Number of manager servers to partition the '
+                        'namespace across, on consecutive ports')
+    parser.add_argument('--shard_map', type=str, default=None,
+                        help='YAML file mapping attribute names (and '
+                        '"readings", "logs") to shard indices, the other '
+                        'attributes are assigned by hash')
     args = parser.parse_args()
     manager.common.init_logging(args)
     logger.info(f'Loaded logging config from {args.logging_config}')
+    if args.stats:
+        client = manager.Client.from_args('stats', args)
+        print(format_stats(client.stats()))
+        return
+    shards = _start_shards(args)
     # Instantiate the manager and serve forever
-    server = manager.Server.from_args(args)
+    server = manager.Server(args.manager_host, args.manager_port,
+                            args.manager_authkey, shards)
     server.run()
 
 
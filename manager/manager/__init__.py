@@ -1,36 +1,82 @@
 from __future__ import annotations
-from multiprocessing.managers import (  # type: ignore
-        BaseManager, NamespaceProxy, Namespace)
-from typing import cast, Dict, Any
+from multiprocessing.managers import BaseManager, Namespace
+from contextlib import contextmanager
+from functools import partial
+from typing import (cast, Dict, Any, Iterator, Optional, Sequence, List,
+                    Tuple)
 import logging
 import argparse
+import threading
 import time
+import weakref
 
 from . import common  # noqa: F401
+from .batch import Batch, Batcher, BatcherProxy
+from .codec import SCHEMA_ATTR, AnyReadingT, ReadingsCodec, ReadingsSchema
+from .logs import LogStore, LogStoreProxy
+from .namespace import VersionedNamespace, VersionedNamespaceProxy, VersionedT
+from .proxy import ClientProxy
+from .readings import ReadingsBuffer, ReadingsBufferProxy
+from .shards import SHARDS_ATTR, ShardedNamespace, ShardMap
+from .stats import ClientStats, EntryT, StatsStore, StatsStoreProxy, StatsT
 
 
 logger = logging.getLogger('manager')
 
 
+# Default capacity of the readings buffer, producers may change it with
+# `ReadingsBufferProxy.set_capacity`
+DEFAULT_HISTORY_LENGTH = 1024
+# Number of log messages kept by the manager
+LOG_CAPACITY = 10000
+
+
 class _GlobManager(BaseManager):
     pass
 
 
 class Server:
 
-    def __init__(self, host: str, port: int, authkey: bytes) -> None:
+    def __init__(self, host: str, port: int, authkey: bytes,
+                 shards: Optional[ShardMap] = None) -> None:
         self.h = host
         self.p = port
         self.k = authkey
         self.manager = _GlobManager(address=(self.h, self.p), authkey=self.k)
         logger.info(f'Attempting to create manager at {self.h}:{self.p}')
-        self.ns = Namespace()
+        self.ns = VersionedNamespace()
+        self.readings = ReadingsBuffer(DEFAULT_HISTORY_LENGTH)
+        self.logs = LogStore(LOG_CAPACITY,
+                             clock=lambda: self.ns.get('time_seconds', 0))
+        self.batcher = Batcher({
+            'ns': (self.ns, VersionedNamespaceProxy._exposed_),
+            'readings': (self.readings, ReadingsBufferProxy._exposed_),
+            'logs': (self.logs, LogStoreProxy._exposed_),
+        })
+        self.stats = StatsStore()
+        # The first shard tells the clients about the others
+        if shards is not None and len(shards) > 1 and port == shards.ports[0]:
+            setattr(self.ns, SHARDS_ATTR, shards.to_dict())
 
         def _get_ns(client_name: str) -> Namespace:
             msg = f'Client in {client_name} retrieved global namespace'
             logger.debug(msg)
             return self.ns
 
+        def _get_readings(client_name: str) -> ReadingsBuffer:
+            msg = f'Client in {client_name} retrieved readings buffer'
+            logger.debug(msg)
+            return self.readings
+
+        def _get_logs(client_name: str) -> LogStore:
+            return self.logs
+
+        def _get_batcher(client_name: str) -> Batcher:
+            return self.batcher
+
+        def _get_stats(client_name: str) -> StatsStore:
+            return self.stats
+
         def _on_connect_hook(client_name: str) -> None:
             logger.info(f'Client "{client_name}" connected')
 
@@ -38,7 +84,15 @@ class Server:
             logger.info(f'Client "{client_name}" disconnected')
 
         self.manager.register('get_ns', callable=_get_ns,
-                              proxytype=NamespaceProxy)
+                              proxytype=VersionedNamespaceProxy)
+        self.manager.register('get_readings', callable=_get_readings,
+                              proxytype=ReadingsBufferProxy)
+        self.manager.register('get_logs', callable=_get_logs,
+                              proxytype=LogStoreProxy)
+        self.manager.register('get_batcher', callable=_get_batcher,
+                              proxytype=BatcherProxy)
+        self.manager.register('get_stats', callable=_get_stats,
+                              proxytype=StatsStoreProxy)
         self.manager.register('on_connect_hook', callable=_on_connect_hook)
         self.manager.register('on_disconnect_hook',
                               callable=_on_disconnect_hook)
@@ -56,43 +110,200 @@ class Server:
 
 class Client:
 
-    def __init__(self, name: str, host: str, port: int, authkey: bytes
-                 ) -> None:
+    def __init__(self, name: str, host: str, port: int, authkey: bytes,
+                 record_stats: bool = True) -> None:
         self.h = host
         self.p = port
         self.k = authkey
         self.manager = _GlobManager(address=(self.h, self.p), authkey=self.k)
+        # One manager per shard, `manager` is the first one
+        self.managers = [self.manager]
+        self._shards: Optional[ShardMap] = None
         self.name = name
-        self.manager.register('get_ns', proxytype=NamespaceProxy)
+        # Last seen (version, value) per attribute, see `get_cached`
+        self._cache: Dict[str, VersionedT] = {}
+        # Published readings schema and its codec, see `get_codec`
+        self._codec: Optional[Tuple[Any, ReadingsCodec]] = None
+        # Proxies are cached per thread and typeid, see `_proxy`
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._pool_stats = dict(created=0, reused=0, reconnects=0)
+        # Call statistics of the proxies, sent to the server, see `stats`
+        self._call_stats = ClientStats(partial(_flush_stats, weakref.ref(self))
+                                       ) if record_stats else None
+        self.manager.register('get_ns', proxytype=VersionedNamespaceProxy)
+        self.manager.register('get_readings', proxytype=ReadingsBufferProxy)
+        self.manager.register('get_logs', proxytype=LogStoreProxy)
+        self.manager.register('get_batcher', proxytype=BatcherProxy)
+        self.manager.register('get_stats', proxytype=StatsStoreProxy)
         self.manager.register('on_connect_hook')
         self.manager.register('on_disconnect_hook')
         self._connect()
-        ns = self.get_ns()
-        if not hasattr(ns, 'logs'):
-            ns.logs = []
+        self._connect_shards()
 
     def __del__(self) -> None:
+        call_stats = getattr(self, '_call_stats', None)
+        if call_stats is not None:
+            call_stats.close()
         try:
             self.manager.on_disconnect_hook(self.name)  # type: ignore
-        except ConnectionRefusedError:
+        except (ConnectionError, ImportError):
+            # ImportError is raised if the interpreter is shutting down
             pass
 
     def get_ns(self) -> Namespace:
+        if self._shards is None:
+            return cast(Namespace, self._proxy('get_ns'))
+        return cast(Namespace, ShardedNamespace(self._shards, self._shard_ns))
+
+    def get_if_changed(self, attr: str, known_version: int = 0
+                       ) -> Optional[VersionedT]:
+        """Return `(version, value)` of a namespace attribute if it changed
+        since `known_version`, `None` otherwise."""
+        ns = cast(VersionedNamespaceProxy, self.get_ns())
+        return ns.get_if_changed(attr, known_version)
+
+    def wait_for(self, attr: str, after_version: int = 0,
+                 timeout: Optional[float] = None) -> Optional[VersionedT]:
+        """Block until a namespace attribute is newer than `after_version`
+        and return `(version, value)`, or `None` if `timeout` expired. With
+        the default `after_version`, this waits until the attribute exists.
+        """
+        ns = cast(VersionedNamespaceProxy, self.get_ns())
+        return ns.wait_for(attr, after_version, timeout)
+
+    def subscribe(self, attr: str, known_version: int = 0,
+                  timeout: Optional[float] = None) -> Iterator[Any]:
+        """Yield the value of a namespace attribute each time it changes.
+        Stops once no change happened within `timeout` seconds."""
+        while True:
+            changed = self.wait_for(attr, known_version, timeout)
+            if changed is None:
+                return
+            known_version, value = changed
+            yield value
+
+    def get_cached(self, attr: str) -> Any:
+        """Same as `getattr(self.get_ns(), attr)`, but the value is only
+        transferred if it changed since the last call. The returned value is
+        shared between calls and must not be modified."""
+        version, value = self._cache.get(attr, (0, None))
+        changed = self.get_if_changed(attr, version)
+        if changed is not None:
+            self._cache[attr] = changed
+            version, value = changed
+        if version == 0:
+            raise AttributeError(f'Namespace has no attribute "{attr}"')
+        return value
+
+    def get_readings(self) -> ReadingsBufferProxy:
+        shard = self._shard('readings')
+        return cast(ReadingsBufferProxy, self._proxy('get_readings', shard))
+
+    def get_codec(self) -> Optional[ReadingsCodec]:
+        """Codec for the readings in the readings buffer, `None` if the
+        producer does not publish a schema."""
+        try:
+            schema = self.get_cached(SCHEMA_ATTR)
+        except AttributeError:
+            return None
+        # `get_cached` returns the same object as long as it is unchanged
+        if self._codec is None or self._codec[0] is not schema:
+            codec = ReadingsCodec(ReadingsSchema.from_dict(schema))
+            self._codec = (schema, codec)
+        return self._codec[1]
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Number of proxies created and reused from the per-thread cache,
+        and of reconnects after a broken connection."""
+        with self._pool_lock:
+            return dict(self._pool_stats, cached=len(self._proxies()))
+
+    def stats(self) -> StatsT:
+        """Call statistics of all clients of the manager by client name and
+        attribute, see `manager.stats`."""
+        if self._call_stats is not None:
+            self._call_stats.flush()
+        return self._get_stats().stats()
+
+    def _get_stats(self) -> StatsStoreProxy:
+        return cast(StatsStoreProxy, self._proxy('get_stats'))
+
+    def _flush_stats(self, entries: Dict[str, EntryT]) -> None:
+        self._get_stats().merge(self.name, entries)
+
+    def _proxies(self) -> Dict[Tuple[str, int], ClientProxy]:
+        """The proxies cached for the current thread, by typeid and shard.
+        """
+        if not hasattr(self._local, 'proxies'):
+            self._local.proxies = {}
+        return cast(Dict[Tuple[str, int], ClientProxy], self._local.proxies)
+
+    def _proxy(self, typeid: str, shard: int = 0) -> ClientProxy:
+        proxies = self._proxies()
+        proxy = proxies.get((typeid, shard))
+        if proxy is not None:
+            self._count('reused')
+            return proxy
+        manager = self.managers[shard]
         try:
-            ns = self.manager.get_ns(self.name)  # type: ignore
-            return cast(Namespace, ns)
+            proxy = getattr(manager, typeid)(self.name)
         except ConnectionRefusedError:
-            self._connect()
-            ns = self.manager.get_ns(self.name)  # type: ignore
-            return cast(Namespace, ns)
+            self._connect(shard)
+            proxy = getattr(manager, typeid)(self.name)
+        assert isinstance(proxy, ClientProxy)
+        # Weak, the proxies must not keep the client alive (see `__del__`)
+        proxy._refresh = partial(_reconnect, weakref.ref(self), typeid, shard)
+        # The statistics are not recorded for their own calls
+        if typeid != 'get_stats':
+            proxy._stats = self._call_stats
+        proxies[(typeid, shard)] = proxy
+        self._count('created')
+        return proxy
+
+    def _reconnect(self, typeid: str, shard: int) -> ClientProxy:
+        """Called by a proxy whose connection broke, returns a new one."""
+        logger.warning(f'Lost connection to manager as "{self.name}", '
+                       'reconnecting')
+        self._count('reconnects')
+        proxies = self._proxies()
+        for key in [key for key in proxies if key[1] == shard]:
+            del proxies[key]
+        self._connect(shard)
+        return self._proxy(typeid, shard)
+
+    def _shard(self, key: str) -> int:
+        return 0 if self._shards is None else self._shards.shard(key)
+
+    def _shard_ns(self, shard: int) -> VersionedNamespaceProxy:
+        return cast(VersionedNamespaceProxy, self._proxy('get_ns', shard))
+
+    def _connect_shards(self) -> None:
+        """Connect to the other shards if the manager is sharded."""
+        layout = self._shard_ns(0).get(SHARDS_ATTR)
+        if layout is None:
+            return
+        self._shards = ShardMap.from_dict(layout)
+        for port in self._shards.ports[1:]:
+            self.managers.append(
+                    _GlobManager(address=(self.h, port), authkey=self.k))
+            self._connect(len(self.managers) - 1)
+        logger.info(f'Manager has {len(self._shards)} shards')
+
+    def _count(self, key: str) -> None:
+        with self._pool_lock:
+            self._pool_stats[key] += 1
 
-    def _connect(self) -> None:
+    def _connect(self, shard: int = 0) -> None:
+        manager = self.managers[shard]
         attempts = 10
         for attempt in range(attempts):
             try:
-                self.manager.connect()
-                self.manager.on_connect_hook(self.name)  # type: ignore
-                logger.info(f'Connected to manager as "{self.name}"')
+                manager.connect()
+                manager.on_connect_hook(self.name)  # type: ignore
+                shard_info = f' (shard {shard})' if shard else ''
+                logger.info(f'Connected to manager{shard_info} as '
+                            f'"{self.name}"')
                 break
             except ConnectionRefusedError:
                 logger.warning('Failed to connect to manager, attempt '
@@ -106,14 +317,63 @@ class Client:
         h, p, k = args.manager_host, args.manager_port, args.manager_authkey
         return cls(name, h, p, k)
 
+    def get_logs(self) -> LogStoreProxy:
+        shard = self._shard('logs')
+        return cast(LogStoreProxy, self._proxy('get_logs', shard))
+
     def log(self, msg: str, lvl: str = 'info') -> None:
-        ns = self.get_ns()
-        if not hasattr(ns, 'logs'):
-            ns.logs = []
-        logs = ns.logs
-        t = ns.time_seconds if hasattr(ns, 'time_seconds') else 0
-        logs.append({'msg': msg, 'level': lvl, 'time_seconds': t})
-        ns.logs = logs
+        self.get_logs().append(msg, lvl)
+
+    @contextmanager
+    def batch(self) -> Iterator[Batch]:
+        """Collect namespace and readings operations and run them in a single
+        round-trip when the `with` block exits:
+
+            with client.batch() as b:
+                i = b.drain('add_faults')
+                b.set('time_seconds', 0.)
+            add_faults = b.results[i]
+        """
+        batch = Batch()
+        yield batch
+        # One round-trip per shard, operations on different shards are not
+        # ordered with respect to each other
+        by_shard: Dict[int, List[int]] = {}
+        for i, (target, _, args) in enumerate(batch.ops):
+            key = args[0] if target == 'ns' else target
+            by_shard.setdefault(self._shard(key), []).append(i)
+        batch.results = [None] * len(batch.ops)
+        for shard, indices in by_shard.items():
+            batcher = cast(BatcherProxy, self._proxy('get_batcher', shard))
+            results = batcher.run([batch.ops[i] for i in indices])
+            for i, result in zip(indices, results):
+                batch.results[i] = result
+
+    def commit_tick(self, reading: AnyReadingT, time_seconds: float,
+                    inboxes: Sequence[str] = ()) -> Dict[str, List[Any]]:
+        """Publish a simulation tick in one round-trip: push the reading,
+        update `time_seconds` and drain the given command inboxes. Returns
+        the drained commands per inbox."""
+        with self.batch() as b:
+            b.push(reading)
+            b.set('time_seconds', time_seconds)
+            indices = {inbox: b.drain(inbox) for inbox in inboxes}
+        return {inbox: b.results[i] for inbox, i in indices.items()}
+
+
+def _reconnect(client_ref: weakref.ref[Client], typeid: str, shard: int
+               ) -> ClientProxy:
+    client = client_ref()
+    if client is None:
+        raise ConnectionError('Client was garbage collected')
+    return client._reconnect(typeid, shard)
+
+
+def _flush_stats(client_ref: weakref.ref[Client],
+                 entries: Dict[str, EntryT]) -> None:
+    client = client_ref()
+    if client is not None:
+        client._flush_stats(entries)
 
 
 def add_manager_arguments(parser: argparse.ArgumentParser) -> None:
@@ -0,0 +1,103 @@
+"""asyncio interface to the manager. The manager protocol of
+`multiprocessing.managers` handles one request at a time per connection, so
+`AsyncClient` runs the calls of a blocking `Client` in a pool of threads,
+each with its own connection, and several requests can be in flight at
+once:
+
+    map_cfg, positions = await client.get_many('map_cfg', 'drone_positions')
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import (Any, AsyncIterator, Callable, List, Optional, Sequence,
+                    TypeVar, cast)
+import argparse
+import asyncio
+
+from . import Client
+from .codec import AnyReadingT
+from .namespace import VersionedNamespaceProxy, VersionedT
+
+
+T = TypeVar('T')
+
+# Number of requests that can be in flight at once by default
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+class AsyncClient:
+    """Awaitable wrapper of a `Client`. Calls that block until something
+    changed (`wait_for`, `subscribe`) run on a separate pool so that they do
+    not hold up the other requests."""
+
+    def __init__(self, client: Client,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_waiters: int = 32) -> None:
+        self.client = client
+        self._requests = ThreadPoolExecutor(
+                max_concurrency, thread_name_prefix=f'{client.name}-aio')
+        self._waiters = ThreadPoolExecutor(
+                max_waiters, thread_name_prefix=f'{client.name}-aio-wait')
+
+    @classmethod
+    def from_args(cls, name: str, args: argparse.Namespace) -> AsyncClient:
+        return cls(Client.from_args(name, args))
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run any blocking call, e.g. a method of `client`, on the pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._requests, partial(fn, *args))
+
+    async def get(self, attr: str, default: Any = None) -> Any:
+        return await self.run(lambda: self._ns().get(attr, default))
+
+    async def get_many(self, *attrs: str) -> List[Any]:
+        """Values of several attributes (`None` if unset), fetched
+        concurrently."""
+        return list(await asyncio.gather(*(self.get(a) for a in attrs)))
+
+    async def get_cached(self, attr: str) -> Any:
+        return await self.run(self.client.get_cached, attr)
+
+    async def set(self, attr: str, value: Any) -> None:
+        await self.run(lambda: setattr(self._ns(), attr, value))
+
+    async def extend(self, attr: str, values: Sequence[Any]) -> None:
+        await self.run(lambda: self._ns().extend(attr, values))
+
+    async def drain(self, attr: str) -> List[Any]:
+        return await self.run(lambda: self._ns().drain(attr))
+
+    async def latest_readings(self, n: Optional[int] = None
+                              ) -> List[AnyReadingT]:
+        return await self.run(lambda: self.client.get_readings().latest(n))
+
+    async def log(self, msg: str, lvl: str = 'info') -> None:
+        await self.run(self.client.log, msg, lvl)
+
+    async def wait_for(self, attr: str, after_version: int = 0,
+                       timeout: Optional[float] = None
+                       ) -> Optional[VersionedT]:
+        loop = asyncio.get_running_loop()
+        wait = partial(self.client.wait_for, attr, after_version, timeout)
+        return await loop.run_in_executor(self._waiters, wait)
+
+    async def subscribe(self, attr: str, known_version: int = 0,
+                        timeout: Optional[float] = None
+                        ) -> AsyncIterator[Any]:
+        """Yield the value of a namespace attribute each time it changes,
+        like `Client.subscribe`."""
+        while True:
+            changed = await self.wait_for(attr, known_version, timeout)
+            if changed is None:
+                return
+            known_version, value = changed
+            yield value
+
+    def close(self) -> None:
+        self._requests.shutdown(wait=False)
+        self._waiters.shutdown(wait=False)
+
+    def _ns(self) -> VersionedNamespaceProxy:
+        # Called in the pool threads, each of which has its own proxy
+        return cast(VersionedNamespaceProxy, self.client.get_ns())
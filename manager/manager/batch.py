@@ -0,0 +1,91 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, cast
+
+from .codec import AnyReadingT
+from .logs import LogStoreProxy
+from .namespace import VersionedNamespaceProxy
+from .proxy import ClientProxy
+from .readings import ReadingsBufferProxy
+
+
+# (target, method, args), where target is one of the objects hosted by the
+# manager server, i.e. 'ns', 'readings' or 'logs'
+OpT = Tuple[str, str, Tuple[Any, ...]]
+
+
+class Batch:
+    """Records operations that the manager server runs in order and in a
+    single round-trip, see `Client.batch`. Each method returns the index of
+    its result in `results`, which is filled in once the batch has run."""
+
+    def __init__(self) -> None:
+        self.ops: List[OpT] = []
+        self.results: List[Any] = []
+
+    def _add(self, target: str, method: str, *args: Any) -> int:
+        self.ops.append((target, method, args))
+        return len(self.ops) - 1
+
+    def get(self, attr: str, default: Any = None) -> int:
+        return self._add('ns', 'get', attr, default)
+
+    def set(self, attr: str, value: Any) -> int:
+        return self._add('ns', '__setattr__', attr, value)
+
+    def extend(self, attr: str, values: Sequence[Any]) -> int:
+        return self._add('ns', 'extend', attr, values)
+
+    def drain(self, attr: str) -> int:
+        return self._add('ns', 'drain', attr)
+
+    def push(self, reading: AnyReadingT) -> int:
+        return self._add('readings', 'push', reading)
+
+    def log(self, msg: str, lvl: str = 'info') -> int:
+        return self._add('logs', 'append', msg, lvl)
+
+
+class Batcher:
+    """Runs batches of operations on the objects hosted by the server. Only
+    methods that the objects' proxies expose may be called."""
+
+    def __init__(self, targets: Dict[str, Tuple[Any, Sequence[str]]]
+                 ) -> None:
+        self.targets = targets
+
+    def run(self, ops: List[OpT]) -> List[Any]:
+        results = []
+        for target, method, args in ops:
+            obj, exposed = self.targets[target]
+            if method not in exposed:
+                raise AttributeError(f'Method "{method}" of "{target}" is '
+                                     'not exposed')
+            results.append(getattr(obj, method)(*args))
+        return results
+
+
+class BatcherProxy(ClientProxy):
+    _exposed_ = ('run',)
+    _stats_attr = 'batch'
+    # Proxies of the targets, which know how to record their operations
+    _targets: Dict[str, Type[ClientProxy]] = {
+        'ns': VersionedNamespaceProxy,
+        'readings': ReadingsBufferProxy,
+        'logs': LogStoreProxy,
+    }
+
+    def _record(self, methodname: str, args: Tuple[Any, ...], result: Any,
+                latency: Optional[float]) -> None:
+        """Record each operation like a separate call, without latency, and
+        the round-trip of the whole batch under 'batch', whose bytes are
+        those of the operations and are not counted again."""
+        assert self._stats is not None
+        ops: List[OpT] = args[0]
+        for (target, method, op_args), op_result in zip(ops, result):
+            attr, op = self._targets[target]._stat_key(method, op_args)
+            payload = op_args if op == 'set' else op_result
+            self._stats.record(attr, op, payload, None)
+        self._stats.record(self._stats_attr, 'set', None, latency,
+                           sized=False)
+
+    def run(self, ops: List[OpT]) -> List[Any]:
+        return cast(List[Any], self._callmethod('run', (ops,)))
@@ -0,0 +1,230 @@
+"""Compact binary encoding of the simulation readings. The field names, turbine
+ids and model names are the same for every tick, so they are kept in a
+`ReadingsSchema` that is published once in the namespace, and each reading is
+packed into a `PackedReading` holding only the values."""
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+import json
+import struct
+import zlib
+
+
+ReadingT = Dict[str, Any]
+
+# Name of the namespace attribute that the producer publishes its schema to
+SCHEMA_ATTR = 'readings_schema'
+# Keys that are not numeric fields and are therefore encoded separately
+_READING_KEYS = ('ticks', 'uptime', 'wts')
+_WT_KEYS = ('wt_id', 'model_name', '_faults')
+# Schema key, ticks, length of the uptime string
+_HEADER = struct.Struct('<Iqi')
+_COUNT = struct.Struct('<i')
+_STR_LEN = struct.Struct('<H')
+
+
+@dataclass(frozen=True)
+class ReadingsSchema:
+    env_fields: Tuple[str, ...]
+    wt_fields: Tuple[str, ...]
+    wt_ids: Tuple[str, ...]
+    model_names: Tuple[str, ...]
+    key: int = field(init=False, compare=False)
+
+    def __post_init__(self) -> None:
+        data = json.dumps(self.to_dict(), sort_keys=True).encode()
+        object.__setattr__(self, 'key', zlib.crc32(data))
+
+    @classmethod
+    def from_reading(cls, reading: ReadingT) -> ReadingsSchema:
+        env_fields = tuple(k for k in reading if k not in _READING_KEYS)
+        wts = reading['wts']
+        wt_fields = tuple(k for k in wts[0] if k not in _WT_KEYS) \
+            if wts else ()
+        return cls(env_fields, wt_fields,
+                   tuple(wt['wt_id'] for wt in wts),
+                   tuple(wt['model_name'] for wt in wts))
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, List[str]]) -> ReadingsSchema:
+        return cls(tuple(d['env_fields']), tuple(d['wt_fields']),
+                   tuple(d['wt_ids']), tuple(d['model_names']))
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        return dict(env_fields=list(self.env_fields),
+                    wt_fields=list(self.wt_fields),
+                    wt_ids=list(self.wt_ids),
+                    model_names=list(self.model_names))
+
+
+class PackedReading:
+    """A single reading encoded by `ReadingsCodec`. Only the tick number can
+    be read without the schema, e.g. by the readings buffer."""
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    @property
+    def schema_key(self) -> int:
+        return int(_HEADER.unpack_from(self.data)[0])
+
+    @property
+    def ticks(self) -> int:
+        return int(_HEADER.unpack_from(self.data)[1])
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (PackedReading, (self.data,))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+AnyReadingT = Union[ReadingT, PackedReading]
+
+
+def get_ticks(reading: AnyReadingT) -> int:
+    if isinstance(reading, PackedReading):
+        return reading.ticks
+    return int(reading['ticks'])
+
+
+class ReadingsCodec:
+    """Layout of a packed reading: header, uptime (utf-8), environment values
+    (float64), turbine values (float64, [turbines, wt_fields] row-major) and
+    finally the faults of the turbines that have any."""
+
+    def __init__(self, schema: ReadingsSchema) -> None:
+        self.schema = schema
+        self._n_env = len(schema.env_fields)
+        self._n_wt = len(schema.wt_ids) * len(schema.wt_fields)
+
+    def encode(self, reading: ReadingT) -> PackedReading:
+        s = self.schema
+        wts = reading['wts']
+        if len(wts) != len(s.wt_ids):
+            raise ValueError(f'Expected {len(s.wt_ids)} turbines, got '
+                             f'{len(wts)}')
+        self._check_fields(reading)
+        uptime = str(reading['uptime']).encode()
+        parts = [_HEADER.pack(s.key, reading['ticks'], len(uptime)), uptime,
+                 array('d', [reading[k] for k in s.env_fields]).tobytes()]
+        values = array('d')
+        faulty = []
+        for i, (wt_id, wt) in enumerate(zip(s.wt_ids, wts)):
+            if wt['wt_id'] != wt_id:
+                raise ValueError(f'Expected turbine {wt_id} at position {i}, '
+                                 f'got {wt["wt_id"]}')
+            values.extend(wt[k] for k in s.wt_fields)
+            if wt['_faults']:
+                faulty.append((i, wt['_faults']))
+        parts.append(values.tobytes())
+        parts.append(_COUNT.pack(len(faulty)))
+        for i, faults in faulty:
+            parts.append(_COUNT.pack(i))
+            parts.append(_STR_LEN.pack(len(faults)))
+            for fault in faults:
+                fault_data = str(fault).encode()
+                parts.append(_STR_LEN.pack(len(fault_data)))
+                parts.append(fault_data)
+        return PackedReading(b''.join(parts))
+
+    def decode(self, reading: AnyReadingT) -> ReadingT:
+        """Unpack into the same dict as the one that was encoded. Readings
+        that are already dicts are returned unchanged."""
+        if not isinstance(reading, PackedReading):
+            return reading
+        s = self.schema
+        data = self._check(reading)
+        _, ticks, uptime_len = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        uptime = data[offset:offset + uptime_len].decode()
+        offset += uptime_len
+        env = self._doubles(data, offset, self._n_env)
+        offset += 8 * self._n_env
+        values = self._doubles(data, offset, self._n_wt)
+        offset += 8 * self._n_wt
+        faults = self._faults(data, offset)
+        n_fields = len(s.wt_fields)
+        wts = []
+        for i, (wt_id, model_name) in enumerate(zip(s.wt_ids, s.model_names)):
+            wt: ReadingT = dict(wt_id=wt_id, model_name=model_name,
+                                _faults=faults.get(i, []))
+            wt.update(zip(s.wt_fields,
+                          values[i * n_fields:(i + 1) * n_fields]))
+            wts.append(wt)
+        decoded: ReadingT = dict(ticks=ticks, uptime=uptime)
+        decoded.update(zip(s.env_fields, env))
+        decoded['wts'] = wts
+        return decoded
+
+    def wt_values(self, reading: PackedReading) -> memoryview:
+        """View of the turbine values (float64), without copying. Can be
+        passed to `numpy.frombuffer` and reshaped to [turbines, wt_fields]."""
+        data = self._check(reading)
+        _, _, uptime_len = _HEADER.unpack_from(data)
+        offset = _HEADER.size + uptime_len + 8 * self._n_env
+        return memoryview(data)[offset:offset + 8 * self._n_wt]
+
+    def wt_faults(self, reading: PackedReading) -> Dict[str, List[str]]:
+        """Faults of the turbines that have any, by turbine id."""
+        data = self._check(reading)
+        _, _, uptime_len = _HEADER.unpack_from(data)
+        offset = _HEADER.size + uptime_len + 8 * (self._n_env + self._n_wt)
+        return {self.schema.wt_ids[i]: faults
+                for i, faults in self._faults(data, offset).items()}
+
+    def matches(self, reading: AnyReadingT) -> bool:
+        """Whether `reading` is packed with the schema of this codec."""
+        return isinstance(reading, PackedReading) \
+            and reading.schema_key == self.schema.key
+
+    def _check(self, reading: PackedReading) -> bytes:
+        if reading.schema_key != self.schema.key:
+            raise ValueError('Reading was encoded with a different schema')
+        return reading.data
+
+    def _check_fields(self, reading: ReadingT) -> None:
+        """Fields that are not in the schema would be dropped, e.g. if a
+        field was added without publishing a new schema."""
+        s = self.schema
+        extra = reading.keys() - set(_READING_KEYS) - set(s.env_fields)
+        if reading['wts']:
+            extra |= reading['wts'][0].keys() - set(_WT_KEYS) \
+                - set(s.wt_fields)
+        if extra:
+            raise ValueError(f'Fields not in the schema: {sorted(extra)}')
+
+    @staticmethod
+    def _doubles(data: bytes, offset: int, n: int) -> List[float]:
+        return list(struct.unpack_from(f'<{n}d', data, offset))
+
+    @staticmethod
+    def _faults(data: bytes, offset: int) -> Dict[int, List[str]]:
+        faults: Dict[int, List[str]] = {}
+        n_faulty, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        for _ in range(n_faulty):
+            i, = _COUNT.unpack_from(data, offset)
+            n, = _STR_LEN.unpack_from(data, offset + _COUNT.size)
+            offset += _COUNT.size + _STR_LEN.size
+            wt_faults = []
+            for _ in range(n):
+                length, = _STR_LEN.unpack_from(data, offset)
+                offset += _STR_LEN.size
+                wt_faults.append(data[offset:offset + length].decode())
+                offset += length
+            faults[i] = wt_faults
+        return faults
+
+
+def decode_all(codec: Optional[ReadingsCodec], readings: List[AnyReadingT]
+               ) -> List[ReadingT]:
+    """Decode a list of readings, which may also contain plain dicts.
+    Packed readings of another schema are skipped, e.g. those from before the
+    producer restarted with a different map, until they leave the buffer."""
+    if codec is None:
+        return [r for r in readings if not isinstance(r, PackedReading)]
+    return [codec.decode(r) for r in readings
+            if not isinstance(r, PackedReading) or codec.matches(r)]
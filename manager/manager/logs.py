@@ -0,0 +1,77 @@
+from collections import deque
+from itertools import takewhile
+from typing import Any, Callable, Deque, Dict, List, Optional, cast
+import threading
+
+from .proxy import ClientProxy
+
+
+LogT = Dict[str, Any]
+
+
+# Severity of the log levels used by the services, for filtering by minimum
+# level. Unknown levels are treated like 'info'.
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'failure': 40, 'error': 40,
+          'critical': 50}
+
+
+class LogStore:
+    """Bounded store of the log messages of all services, living in the
+    manager server. Each entry gets an increasing id, which readers use as a
+    cursor to fetch only new entries."""
+
+    def __init__(self, capacity: int,
+                 clock: Callable[[], float] = lambda: 0.) -> None:
+        self._lock = threading.Lock()
+        self._logs: Deque[LogT] = deque(maxlen=capacity)
+        self._next_id = 0
+        # Simulation time used to stamp the entries
+        self._clock = clock
+
+    def append(self, msg: str, level: str = 'info') -> int:
+        with self._lock:
+            log_id = self._next_id
+            self._next_id += 1
+            self._logs.append({'id': log_id, 'msg': msg, 'level': level,
+                               'time_seconds': self._clock()})
+            return log_id
+
+    def read(self, since_id: int = -1, limit: Optional[int] = None,
+             level: Optional[str] = None) -> List[LogT]:
+        """Entries with `id > since_id` and at least the given level, oldest
+        first. With `limit`, only the newest `limit` of them, e.g. for the
+        first read of a reader that then polls with the newest id."""
+        min_severity = _severity(level) if level is not None else 0
+        with self._lock:
+            # Walk backwards so that only the new entries are visited
+            new = list(takewhile(lambda log: bool(log['id'] > since_id),
+                                 reversed(self._logs)))
+        new.reverse()
+        logs = [log for log in new if _severity(log['level']) >= min_severity]
+        return logs if limit is None else logs[len(logs) - limit:]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._logs)
+
+
+def _severity(level: str) -> int:
+    return LEVELS.get(level.lower(), LEVELS['info'])
+
+
+class LogStoreProxy(ClientProxy):
+    _exposed_ = ('append', 'read', '__len__')
+    _stats_attr = 'logs'
+    _set_methods = ('append',)
+    _retry_methods = ('read', '__len__')
+
+    def append(self, msg: str, level: str = 'info') -> int:
+        return cast(int, self._callmethod('append', (msg, level)))
+
+    def read(self, since_id: int = -1, limit: Optional[int] = None,
+             level: Optional[str] = None) -> List[LogT]:
+        args = (since_id, limit, level)
+        return cast(List[LogT], self._callmethod('read', args))
+
+    def __len__(self) -> int:
+        return cast(int, self._callmethod('__len__'))
@@ -0,0 +1,125 @@
+from multiprocessing.managers import (  # type: ignore
+        Namespace, NamespaceProxy)
+from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
+import threading
+import time
+
+from .proxy import ClientProxy
+
+
+# (version, value) pair as returned by `get_if_changed`
+VersionedT = Tuple[int, Any]
+
+
+class VersionedNamespace(Namespace):
+    """Namespace that keeps a monotonically increasing version per attribute.
+    Attributes that were never set have version 0. The versions of the other
+    attributes start at the creation time of the namespace in nanoseconds, so
+    that those of a restarted manager do not repeat the versions that clients
+    saw before and may have cached, see `Client.get_cached`."""
+
+    def __init__(self, **kwds: Any) -> None:
+        object.__setattr__(self, '_cond', threading.Condition())
+        object.__setattr__(self, '_versions', {})
+        object.__setattr__(self, '_first_version', time.time_ns())
+        for key, value in kwds.items():
+            setattr(self, key, value)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        with self._cond:
+            object.__setattr__(self, key, value)
+            self._bump(key)
+
+    def __delattr__(self, key: str) -> None:
+        with self._cond:
+            object.__delattr__(self, key)
+            self._bump(key)
+
+    def _bump(self, key: str) -> None:
+        versions = cast(Dict[str, int], self._versions)
+        versions[key] = versions.get(key, self._first_version) + 1
+        self._cond.notify_all()
+
+    def version(self, key: str) -> int:
+        with self._cond:
+            return cast(int, self._versions.get(key, 0))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def extend(self, key: str, values: Sequence[Any]) -> None:
+        """Atomically append to a list attribute, creating it if needed."""
+        if not values:
+            return
+        with self._cond:
+            setattr(self, key, list(getattr(self, key, [])) + list(values))
+
+    def drain(self, key: str) -> List[Any]:
+        """Atomically take all items of a list attribute and reset it to the
+        empty list, e.g. for command inboxes."""
+        with self._cond:
+            items = list(getattr(self, key, []))
+            if items:
+                setattr(self, key, [])
+            return items
+
+    def get_if_changed(self, key: str, known_version: int = 0
+                       ) -> Optional[VersionedT]:
+        """Return `(version, value)` if `key` changed since `known_version`,
+        `None` otherwise."""
+        with self._cond:
+            version = self._versions.get(key, 0)
+            if version == known_version:
+                return None
+            return version, object.__getattribute__(self, key)
+
+    def wait_for(self, key: str, after_version: int = 0,
+                 timeout: Optional[float] = None) -> Optional[VersionedT]:
+        """Block until the version of `key` exceeds `after_version` and
+        return `(version, value)`, or `None` if `timeout` expired."""
+        with self._cond:
+            changed = self._cond.wait_for(
+                lambda: bool(self._versions.get(key, 0) > after_version),
+                timeout)
+            if not changed:
+                return None
+            return self._versions[key], object.__getattribute__(self, key)
+
+
+class VersionedNamespaceProxy(ClientProxy, NamespaceProxy):  # type: ignore
+    _exposed_ = NamespaceProxy._exposed_ + ('get', 'extend', 'drain',
+                                            'version', 'get_if_changed',
+                                            'wait_for')
+    _set_methods = ('__setattr__', '__delattr__', 'extend')
+    _blocking_methods = ('wait_for',)
+    _retry_methods = ('__getattribute__', 'get', 'version', 'get_if_changed',
+                      'wait_for')
+
+    @classmethod
+    def _stat_key(cls, methodname: str, args: Tuple[Any, ...]
+                  ) -> Tuple[str, str]:
+        # All methods take the attribute name as their first argument
+        op = 'set' if methodname in cls._set_methods else 'get'
+        return args[0], op
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._callmethod('get', (key, default))
+
+    def extend(self, key: str, values: Sequence[Any]) -> None:
+        self._callmethod('extend', (key, values))
+
+    def drain(self, key: str) -> List[Any]:
+        return cast(List[Any], self._callmethod('drain', (key,)))
+
+    def version(self, key: str) -> int:
+        return cast(int, self._callmethod('version', (key,)))
+
+    def get_if_changed(self, key: str, known_version: int = 0
+                       ) -> Optional[VersionedT]:
+        return cast(Optional[VersionedT],
+                    self._callmethod('get_if_changed', (key, known_version)))
+
+    def wait_for(self, key: str, after_version: int = 0,
+                 timeout: Optional[float] = None) -> Optional[VersionedT]:
+        args = (key, after_version, timeout)
+        return cast(Optional[VersionedT], self._callmethod('wait_for', args))
@@ -0,0 +1,68 @@
+from __future__ import annotations
+from multiprocessing.managers import BaseProxy
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Optional, Sequence,
+                    Tuple)
+import time
+
+if TYPE_CHECKING:
+    from .stats import ClientStats
+
+
+# Raised by the proxies if the manager server went away
+CONNECTION_ERRORS = (EOFError, ConnectionError)
+
+
+class ClientProxy(BaseProxy):
+    """Base class of the proxies cached by `Client`. If the connection to the
+    manager breaks, e.g. because the server restarted, a fresh proxy is
+    obtained from `_refresh` and calls of `_retry_methods` are retried once
+    on it. Other calls raise, as the server may already have applied them.
+    Calls are recorded in `_stats` if it is set."""
+    _refresh: Optional[Callable[[], ClientProxy]] = None
+    _stats: Optional[ClientStats] = None
+    # Name under which calls are recorded if they do not refer to a namespace
+    # attribute, methods that count as sets and methods that block until
+    # something changed, whose latency is not recorded
+    _stats_attr = ''
+    _set_methods: Sequence[str] = ()
+    _blocking_methods: Sequence[str] = ()
+    # Reads, which can be repeated safely
+    _retry_methods: Sequence[str] = ()
+
+    def _callmethod(self, methodname: str, args: Tuple[Any, ...] = (),
+                    kwds: Dict[Any, Any] = {}) -> Any:
+        start = time.perf_counter()
+        try:
+            result = super()._callmethod(methodname, args, kwds)
+        except CONNECTION_ERRORS:
+            if self._refresh is None:
+                raise
+            # Make the next proxy for this address in this thread open a new
+            # connection instead of reusing the broken one
+            try:
+                del self._tls.connection  # type: ignore
+            except AttributeError:
+                pass
+            proxy = self._refresh()
+            if methodname not in self._retry_methods:
+                raise
+            # The fresh proxy records the call in the same `_stats`
+            return proxy._callmethod(methodname, args, kwds)
+        if self._stats is not None:
+            latency = None if methodname in self._blocking_methods \
+                else time.perf_counter() - start
+            self._record(methodname, args, result, latency)
+        return result
+
+    @classmethod
+    def _stat_key(cls, methodname: str, args: Tuple[Any, ...]
+                  ) -> Tuple[str, str]:
+        """Attribute and operation ('get' or 'set') of a call."""
+        op = 'set' if methodname in cls._set_methods else 'get'
+        return cls._stats_attr, op
+
+    def _record(self, methodname: str, args: Tuple[Any, ...], result: Any,
+                latency: Optional[float]) -> None:
+        assert self._stats is not None
+        attr, op = self._stat_key(methodname, args)
+        self._stats.record(attr, op, args if op == 'set' else result, latency)
@@ -0,0 +1,111 @@
+from collections import deque
+from itertools import islice, takewhile
+from typing import Deque, List, Optional, cast
+import threading
+
+from .codec import AnyReadingT as ReadingT, get_ticks
+from .proxy import ClientProxy
+
+
+class ReadingsBuffer:
+    """Bounded ring buffer of simulation readings, living in the manager
+    server. Readings are returned newest first, i.e. in the same order as the
+    old `readings_queue` list. Readings are either dicts or `PackedReading`s,
+    see `manager.codec`.
+
+    If a pushed reading is not newer than the newest one, e.g. because
+    datagen resumed from an older checkpoint or a recording is replayed, the
+    ticks went back and the buffer is cleared. Consumers waiting for readings
+    after a tick that is now in the future get all readings, so they can
+    detect the rewind by the newest tick being older than the last one they
+    saw and start over."""
+
+    def __init__(self, capacity: int) -> None:
+        self._cond = threading.Condition()
+        # Stored oldest first so that `deque` drops the oldest reading
+        self._buf: Deque[ReadingT] = deque(maxlen=capacity)
+
+    def push(self, reading: ReadingT) -> None:
+        with self._cond:
+            if self._buf and get_ticks(reading) <= get_ticks(self._buf[-1]):
+                self._buf.clear()
+            self._buf.append(reading)
+            self._cond.notify_all()
+
+    def clear(self) -> None:
+        """Drop all readings, e.g. before publishing those of another run."""
+        with self._cond:
+            self._buf.clear()
+
+    def latest(self, n: Optional[int] = None) -> List[ReadingT]:
+        with self._cond:
+            return list(islice(reversed(self._buf), n))
+
+    def since(self, tick: int) -> List[ReadingT]:
+        """All readings with `reading['ticks'] > tick`, or all readings if
+        the ticks went back since `tick`."""
+        with self._cond:
+            return self._since(tick)
+
+    def wait_since(self, tick: int, timeout: Optional[float] = None
+                   ) -> List[ReadingT]:
+        """Like `since`, but block until at least one such reading has been
+        pushed or `timeout` expired."""
+        with self._cond:
+            self._cond.wait_for(lambda: bool(self._since(tick, 1)), timeout)
+            return self._since(tick)
+
+    def _since(self, tick: int, n: Optional[int] = None) -> List[ReadingT]:
+        if self._buf and get_ticks(self._buf[-1]) < tick:
+            return list(islice(reversed(self._buf), n))
+        newer = takewhile(lambda r: get_ticks(r) > tick,
+                          reversed(self._buf))
+        return list(islice(newer, n))
+
+    def set_capacity(self, capacity: int) -> None:
+        with self._cond:
+            if capacity != self._buf.maxlen:
+                self._buf = deque(self._buf, maxlen=capacity)
+
+    def capacity(self) -> int:
+        with self._cond:
+            return cast(int, self._buf.maxlen)
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._buf)
+
+
+class ReadingsBufferProxy(ClientProxy):
+    _exposed_ = ('push', 'clear', 'latest', 'since', 'wait_since',
+                 'set_capacity', 'capacity', '__len__')
+    _stats_attr = 'readings'
+    _set_methods = ('push', 'clear', 'set_capacity')
+    _blocking_methods = ('wait_since',)
+    _retry_methods = ('latest', 'since', 'wait_since', 'capacity', '__len__')
+
+    def push(self, reading: ReadingT) -> None:
+        self._callmethod('push', (reading,))
+
+    def clear(self) -> None:
+        self._callmethod('clear')
+
+    def latest(self, n: Optional[int] = None) -> List[ReadingT]:
+        return cast(List[ReadingT], self._callmethod('latest', (n,)))
+
+    def since(self, tick: int) -> List[ReadingT]:
+        return cast(List[ReadingT], self._callmethod('since', (tick,)))
+
+    def wait_since(self, tick: int, timeout: Optional[float] = None
+                   ) -> List[ReadingT]:
+        return cast(List[ReadingT],
+                    self._callmethod('wait_since', (tick, timeout)))
+
+    def set_capacity(self, capacity: int) -> None:
+        self._callmethod('set_capacity', (capacity,))
+
+    def capacity(self) -> int:
+        return cast(int, self._callmethod('capacity'))
+
+    def __len__(self) -> int:
+        return cast(int, self._callmethod('__len__'))
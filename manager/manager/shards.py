@@ -0,0 +1,98 @@
+"""Sharded deployment of the manager: the namespace attributes and hosted
+objects are partitioned across several manager servers, e.g. so that pushing
+readings does not hold up small control-plane attributes. The first shard
+publishes the layout in its namespace, from where clients pick it up."""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Sequence, cast
+import zlib
+
+from .namespace import VersionedNamespaceProxy, VersionedT
+
+
+# Name of the namespace attribute of the first shard holding the layout
+SHARDS_ATTR = 'manager_shards'
+# Attributes and hosted objects pinned to a shard unless configured
+# otherwise. The log store stamps entries with `time_seconds` and needs it on
+# the same shard; negative shards count from the end.
+DEFAULT_SHARD_MAP = {'time_seconds': 0, 'logs': 0, 'readings': -1}
+
+
+class ShardMap:
+    """Maps namespace attributes and hosted objects ('readings', 'logs') to
+    the index of their shard, either statically (`static`, which extends
+    `DEFAULT_SHARD_MAP`) or by hashing the key."""
+
+    def __init__(self, ports: Sequence[int],
+                 static: Optional[Dict[str, int]] = None) -> None:
+        if not ports:
+            raise ValueError('At least one shard is required')
+        self.ports = list(ports)
+        static = {**DEFAULT_SHARD_MAP, **(static or {})}
+        for key, shard in static.items():
+            if not -len(self.ports) <= shard < len(self.ports):
+                raise ValueError(f'Shard {shard} of "{key}" does not exist')
+        self.static = {key: shard % len(self.ports)
+                       for key, shard in static.items()}
+
+    def __len__(self) -> int:
+        return len(self.ports)
+
+    def shard(self, key: str) -> int:
+        shard = self.static.get(key)
+        if shard is None:
+            # Stable across processes, unlike `hash`
+            shard = zlib.crc32(key.encode()) % len(self.ports)
+        return shard
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> ShardMap:
+        return cls(d['ports'], d['static'])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(ports=self.ports, static=self.static)
+
+
+class ShardedNamespace:
+    """Behaves like the namespace proxy, but routes each attribute to the
+    namespace of its shard. `get_ns` returns the proxy of a shard."""
+
+    def __init__(self, shards: ShardMap,
+                 get_ns: Callable[[int], VersionedNamespaceProxy]) -> None:
+        object.__setattr__(self, '_shards', shards)
+        object.__setattr__(self, '_get_ns', get_ns)
+
+    def _ns(self, key: str) -> VersionedNamespaceProxy:
+        shards = cast(ShardMap, self._shards)
+        return cast(VersionedNamespaceProxy,
+                    self._get_ns(shards.shard(key)))
+
+    def __getattr__(self, key: str) -> Any:
+        if key.startswith('_'):
+            raise AttributeError(key)
+        return getattr(self._ns(key), key)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        setattr(self._ns(key), key, value)
+
+    def __delattr__(self, key: str) -> None:
+        delattr(self._ns(key), key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._ns(key).get(key, default)
+
+    def extend(self, key: str, values: Sequence[Any]) -> None:
+        self._ns(key).extend(key, values)
+
+    def drain(self, key: str) -> List[Any]:
+        return self._ns(key).drain(key)
+
+    def version(self, key: str) -> int:
+        return self._ns(key).version(key)
+
+    def get_if_changed(self, key: str, known_version: int = 0
+                       ) -> Optional[VersionedT]:
+        return self._ns(key).get_if_changed(key, known_version)
+
+    def wait_for(self, key: str, after_version: int = 0,
+                 timeout: Optional[float] = None) -> Optional[VersionedT]:
+        return self._ns(key).wait_for(key, after_version, timeout)
@@ -0,0 +1,152 @@
+"""Optional shared-memory transport for readings between services running on
+the same host. The latest ticks are kept in a fixed-schema NumPy array of
+shape [capacity, turbines, fields], readers map the segment directly instead
+of receiving pickled readings from the manager. Requires NumPy, which is why
+this module is not imported by `manager` itself."""
+from __future__ import annotations
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+import time
+import numpy as np
+import numpy.typing as npt
+
+
+logger = logging.getLogger('manager')
+
+
+# Numeric per-turbine fields of the readings
+FIELDS = ('power', 'rotor_rps', 'generator_temp', 'tower_vib_freq')
+# Name of the namespace attribute that the writer publishes its spec to
+SPEC_ATTR = 'readings_shm'
+# Header layout (int64): sequence counter of the seqlock, ticks pushed so far
+_SEQ, _COUNT, _HEADER_LEN = 0, 1, 2
+
+
+class SharedReadings:
+    """Ring buffer of readings in shared memory, guarded by a seqlock: the
+    writer makes the sequence counter odd while it updates a row, readers
+    retry until they observe the same even counter before and after
+    reading."""
+
+    def __init__(self, shm: SharedMemory, capacity: int, wt_ids: List[str],
+                 fields: Sequence[str], owner: bool = False) -> None:
+        self.shm = shm
+        self.capacity = capacity
+        self.wt_ids = wt_ids
+        self.fields = tuple(fields)
+        self.owner = owner
+        self._wt_index = {wt_id: i for i, wt_id in enumerate(wt_ids)}
+        self._header, self._ticks, self._values = _views(
+                shm, capacity, len(wt_ids), len(self.fields))
+
+    @classmethod
+    def create(cls, name: str, capacity: int, wt_ids: List[str],
+               fields: Sequence[str] = FIELDS) -> SharedReadings:
+        size = _size(capacity, len(wt_ids), len(fields))
+        try:
+            shm = SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left over from a previous run of the writer
+            stale = SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = SharedMemory(name=name, create=True, size=size)
+        readings = cls(shm, capacity, wt_ids, fields, owner=True)
+        readings._header[:] = 0
+        logger.info(f'Created shared readings "{name}" ({size} bytes)')
+        return readings
+
+    @classmethod
+    def attach(cls, spec: Dict[str, Any]) -> SharedReadings:
+        shm = SharedMemory(name=spec['name'])
+        # Only the writer may unlink the segment, but Python's resource
+        # tracker would do so when this (reading) process exits.
+        resource_tracker.unregister(shm._name, 'shared_memory')  # type: ignore
+        return cls(shm, spec['capacity'], spec['wt_ids'], spec['fields'])
+
+    @property
+    def spec(self) -> Dict[str, Any]:
+        """Everything readers need to attach, published in the namespace."""
+        return dict(name=self.shm.name, capacity=self.capacity,
+                    wt_ids=self.wt_ids, fields=list(self.fields))
+
+    def push(self, reading: Dict[str, Any]) -> None:
+        row = np.full((len(self.wt_ids), len(self.fields)), np.nan)
+        for wt in reading['wts']:
+            i = self._wt_index.get(wt['wt_id'])
+            if i is None:
+                continue
+            row[i] = [wt.get(f, np.nan) for f in self.fields]
+        count = int(self._header[_COUNT])
+        slot = count % self.capacity
+        self._header[_SEQ] += 1
+        self._ticks[slot] = reading['ticks']
+        self._values[slot] = row
+        self._header[_COUNT] = count + 1
+        self._header[_SEQ] += 1
+
+    def latest(self, n: Optional[int] = None
+               ) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+        """Ticks of shape [n] and values of shape [n, turbines, fields] of
+        the `n` newest readings, newest first. This is a consistent snapshot,
+        i.e. a single copy of the requested rows out of the ring."""
+        while True:
+            seq = int(self._header[_SEQ])
+            if seq % 2:
+                time.sleep(0)
+                continue
+            count = int(self._header[_COUNT])
+            k = min(count, self.capacity)
+            if n is not None:
+                k = min(k, n)
+            slots = (count - 1 - np.arange(k)) % self.capacity
+            ticks = self._ticks[slots]
+            values = self._values[slots]
+            if int(self._header[_SEQ]) == seq:
+                return ticks, values
+
+    def column(self, field: str) -> int:
+        return self.fields.index(field)
+
+    def close(self) -> None:
+        # Drop the views before closing, the buffer cannot be released
+        # while they exist
+        del self._header, self._ticks, self._values
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def try_attach(spec: Optional[Dict[str, Any]]) -> Optional[SharedReadings]:
+    """Attach to the shared readings if the writer runs on the same host,
+    `None` otherwise."""
+    if spec is None:
+        return None
+    try:
+        readings = SharedReadings.attach(spec)
+    except FileNotFoundError:
+        logger.info(f'Shared readings "{spec["name"]}" not available on this '
+                    'host')
+        return None
+    logger.info(f'Attached to shared readings "{spec["name"]}"')
+    return readings
+
+
+def _size(capacity: int, n_wts: int, n_fields: int) -> int:
+    return 8 * (_HEADER_LEN + capacity + capacity * n_wts * n_fields)
+
+
+def _views(shm: SharedMemory, capacity: int, n_wts: int, n_fields: int
+           ) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64],
+                      npt.NDArray[np.float64]]:
+    header: npt.NDArray[np.int64] = np.ndarray(
+            (_HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+    ticks: npt.NDArray[np.int64] = np.ndarray(
+            (capacity,), dtype=np.int64, buffer=shm.buf,
+            offset=8 * _HEADER_LEN)
+    values: npt.NDArray[np.float64] = np.ndarray(
+            (capacity, n_wts, n_fields), dtype=np.float64, buffer=shm.buf,
+            offset=8 * (_HEADER_LEN + capacity))
+    return header, ticks, values
@@ -0,0 +1,194 @@
+"""Call statistics of the manager clients. Each `Client` records the calls of
+its proxies per namespace attribute (or hosted object, e.g. 'readings') and
+periodically merges them into the `StatsStore` of the server, where they can
+be read with `Client.stats()` or `manager/cli.py --stats`. The transferred
+bytes are estimated from the pickled size of a sample of the payloads, so
+that recording does not serialize every value a second time."""
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+import pickle
+import threading
+import weakref
+
+from .proxy import CONNECTION_ERRORS, ClientProxy
+
+
+# {'gets', 'sets', 'get_bytes', 'set_bytes', 'latency'}, see `_new_entry`
+EntryT = Dict[str, Any]
+# Entries by client name and attribute
+StatsT = Dict[str, Dict[str, EntryT]]
+
+# Upper bounds in ms of the round-trip latency histogram buckets, the last
+# bucket counts everything slower
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1., 2.5, 5., 10., 25., 50., 100., 250.,
+                      1000.)
+# Interval in seconds at which clients send their statistics to the server
+FLUSH_INTERVAL = 1.
+# The size of one in this many payloads per attribute and operation is
+# measured, and counted for the calls since the previous measurement
+SIZE_SAMPLE = 16
+
+
+def _new_entry() -> EntryT:
+    return dict(gets=0, sets=0, get_bytes=0, set_bytes=0,
+                latency=[0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+
+def _merge_entry(into: EntryT, entry: EntryT) -> None:
+    for key in ('gets', 'sets', 'get_bytes', 'set_bytes'):
+        into[key] += entry[key]
+    into['latency'] = [a + b for a, b in zip(into['latency'],
+                                             entry['latency'])]
+
+
+class ClientStats:
+    """Statistics recorded by the proxies of one client, in any thread. They
+    are handed to `flush` every `FLUSH_INTERVAL` seconds by a background
+    thread, outside of the recorded calls."""
+
+    def __init__(self, flush: Callable[[Dict[str, EntryT]], None]) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[str, EntryT] = {}
+        # Calls without a measured size by attribute and operation
+        self._unsized: Dict[Tuple[str, str], int] = {}
+        self._flush = flush
+        self._thread: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+
+    def record(self, attr: str, op: str, payload: Any,
+               latency: Optional[float], sized: bool = True) -> None:
+        """Record a 'get' or 'set' of `attr`. `payload` is the transferred
+        value, `latency` the round-trip time in seconds or `None` if it
+        should not count, e.g. for calls that block until a change. Without
+        `sized`, the payload is not counted, e.g. because its parts are
+        recorded separately."""
+        key = (attr, op)
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            entry = self._entries.get(attr)
+            if entry is None:
+                entry = self._entries[attr] = _new_entry()
+            entry[op + 's'] += 1
+            if latency is not None:
+                bucket = bisect_left(LATENCY_BUCKETS_MS, latency * 1000)
+                entry['latency'][bucket] += 1
+            if not sized:
+                return
+            # The first call is always measured
+            calls = self._unsized.get(key, 0) + 1
+            measure = calls >= SIZE_SAMPLE or key not in self._unsized
+            self._unsized[key] = 0 if measure else calls
+        if not measure:
+            return
+        size = len(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            entry = self._entries.setdefault(attr, _new_entry())
+            entry[op + '_bytes'] += size * calls
+
+    def flush(self) -> None:
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        if entries:
+            self._flush(entries)
+
+    def close(self) -> None:
+        self._closed.set()
+
+    def _start(self) -> None:
+        self._thread = threading.Thread(
+                target=_flush_periodically, args=(weakref.ref(self),),
+                name='manager-stats', daemon=True)
+        self._thread.start()
+
+
+def _flush_periodically(stats_ref: 'weakref.ref[ClientStats]') -> None:
+    while True:
+        stats = stats_ref()
+        if stats is None or stats._closed.wait(FLUSH_INTERVAL):
+            return
+        try:
+            stats.flush()
+        except CONNECTION_ERRORS:
+            # The statistics of this interval are lost, the next flush
+            # reconnects
+            pass
+        del stats
+
+
+class StatsStore:
+    """Statistics of all clients, living in the manager server."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: StatsT = {}
+
+    def merge(self, client_name: str, entries: Dict[str, EntryT]) -> None:
+        with self._lock:
+            client = self._stats.setdefault(client_name, {})
+            for attr, entry in entries.items():
+                _merge_entry(client.setdefault(attr, _new_entry()), entry)
+
+    def stats(self) -> StatsT:
+        with self._lock:
+            return {client: {attr: dict(entry)
+                             for attr, entry in attrs.items()}
+                    for client, attrs in self._stats.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+class StatsStoreProxy(ClientProxy):
+    _exposed_ = ('merge', 'stats', 'reset')
+    _retry_methods = ('stats',)
+
+    def merge(self, client_name: str, entries: Dict[str, EntryT]) -> None:
+        self._callmethod('merge', (client_name, entries))
+
+    def stats(self) -> StatsT:
+        return cast(StatsT, self._callmethod('stats'))
+
+    def reset(self) -> None:
+        self._callmethod('reset')
+
+
+def latency_quantile(histogram: List[int], q: float) -> float:
+    """Upper bound in ms of the bucket containing the `q` quantile, `inf` if
+    it is in the last bucket and `nan` if there are no samples."""
+    total = sum(histogram)
+    if not total:
+        return float('nan')
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS + (float('inf'),), histogram):
+        seen += count
+        if seen >= q * total:
+            return bound
+    return float('inf')
+
+
+def format_stats(stats: StatsT) -> str:
+    """Table of the statistics per attribute, summed over all clients and
+    sorted by transferred bytes, followed by the clients using it."""
+    totals: Dict[str, EntryT] = {}
+    users: Dict[str, List[Tuple[int, str]]] = {}
+    for client, attrs in stats.items():
+        for attr, entry in attrs.items():
+            _merge_entry(totals.setdefault(attr, _new_entry()), entry)
+            calls = entry['gets'] + entry['sets']
+            users.setdefault(attr, []).append((calls, client))
+    header = (f'{"attribute":<24}{"gets":>10}{"sets":>10}{"get KiB":>12}'
+              f'{"set KiB":>12}{"p50 ms":>9}{"p99 ms":>9}  clients')
+    lines = [header]
+    for attr, entry in sorted(totals.items(), key=lambda kv: -(
+            kv[1]['get_bytes'] + kv[1]['set_bytes'])):
+        clients = ', '.join(f'{client} ({calls})' for calls, client
+                            in sorted(users[attr], reverse=True))
+        lines.append(
+            f'{attr:<24}{entry["gets"]:>10}{entry["sets"]:>10}'
+            f'{entry["get_bytes"] / 1024:>12.1f}'
+            f'{entry["set_bytes"] / 1024:>12.1f}'
+            f'{latency_quantile(entry["latency"], .5):>9}'
+            f'{latency_quantile(entry["latency"], .99):>9}  {clients}')
+    return '\n'.join(lines)
@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 import argparse
 from logging import getLogger
-import time
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+import numpy.typing as npt
 
 import manager
-from sensor_service import get_fault_alerts
+import manager.shm
+from manager.codec import AnyReadingT, PackedReading, decode_all, get_ticks
+from sensor_service import StreamingDetector, get_fault_alerts
 
 
 logger = getLogger('sensor_service')
 
 
+# Seconds after which a blocking wait for new readings is retried
+WAIT_TIMEOUT = 10.
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     manager.common.add_logging_args(parser)
@@ -18,18 +26,94 @@ def main() -> None:
     manager.common.init_logging(args)
     client = manager.Client.from_args('sensor_service', args)
     client.get_ns().sensor_alerts = []
+    last_tick = -1
+    # Shared memory readings, if datagen publishes them on this host
+    shared = None
+    spec_version = 0
+    # Keeps the state of the fault detection between ticks, only the new
+    # readings are added to it
+    detector: Optional[StreamingDetector] = None
     while True:
-        ns = client.get_ns()
-        if not hasattr(ns, 'readings_queue') or not ns.readings_queue:
-            time.sleep(0.1)  # lmao
+        # Block until datagen publishes a new tick
+        new_readings = client.get_readings().wait_since(last_tick,
+                                                        timeout=WAIT_TIMEOUT)
+        if not new_readings:
             continue
-        alert_wt_ids = get_fault_alerts(ns.readings_queue)
+        if get_ticks(new_readings[0]) < last_tick:
+            # The ticks went back, e.g. datagen resumed from an older
+            # checkpoint, start over with the readings of the new run
+            logger.info(f'Ticks went back from {last_tick} to '
+                        f'{get_ticks(new_readings[0])}, resetting')
+            last_tick = -1
+            detector = None
+        changed = client.get_if_changed(manager.shm.SPEC_ATTR, spec_version)
+        if changed is not None:
+            spec_version, spec = changed
+            if shared is not None:
+                shared.close()
+            shared = manager.shm.try_attach(spec)
+        new = _new_values(client, shared, new_readings, last_tick)
+        last_tick = get_ticks(new_readings[0])
+        if new is None:
+            # Readings without a schema, from an old datagen, or none in the
+            # current schema
+            alert_wt_ids = get_fault_alerts(decode_all(
+                    client.get_codec(), client.get_readings().latest()))
+        else:
+            wt_ids, fields, ticks, values = new
+            history = client.get_readings().capacity() if shared is None \
+                else shared.capacity
+            if detector is None or detector.wt_ids != wt_ids \
+                    or detector.history != history:
+                detector = StreamingDetector(wt_ids, history)
+            power = fields.index('power')
+            # Oldest first
+            for tick, wt_values in zip(ticks[::-1], values[::-1]):
+                detector.push(int(tick), wt_values, power)
+            alert_wt_ids = detector.alerts()
         if alert_wt_ids:
             msg = f'Alerts for: {alert_wt_ids}'
             logger.info(msg)
             client.log(msg, 'warning')
-        ns.sensor_alerts = alert_wt_ids
-        time.sleep(1.0)
+        client.get_ns().sensor_alerts = alert_wt_ids
+
+
+def _new_values(client: manager.Client,
+                shared: Optional[manager.shm.SharedReadings],
+                new_readings: List[AnyReadingT], last_tick: int
+                ) -> Optional[Tuple[List[str], Sequence[str],
+                                    npt.NDArray[np.int64],
+                                    npt.NDArray[np.float64]]]:
+    """Turbine ids, fields, ticks and values of shape [ticks, turbines,
+    fields] of the readings after `last_tick`, newest first."""
+    if shared is not None:
+        # The shared readings may be ahead of the manager, fetch until all
+        # ticks after `last_tick` are included
+        n = len(new_readings)
+        while True:
+            ticks, values = shared.latest(n)
+            if len(ticks) < n or ticks[-1] <= last_tick:
+                break
+            n *= 2
+        new = ticks > last_tick
+        return shared.wt_ids, shared.fields, ticks[new], values[new]
+    codec = client.get_codec()
+    if codec is None:
+        return None
+    # View the turbine values of the packed readings as arrays, without
+    # decoding them into dicts
+    schema = codec.schema
+    # Readings of another schema are skipped, e.g. those from before datagen
+    # restarted with a different map
+    packed = [r for r in new_readings
+              if isinstance(r, PackedReading) and codec.matches(r)]
+    if not packed:
+        return None
+    ticks = np.array([r.ticks for r in packed], dtype=np.int64)
+    values = np.stack([np.frombuffer(codec.wt_values(r), dtype=np.float64)
+                       for r in packed])
+    values = values.reshape(len(packed), len(schema.wt_ids), -1)
+    return list(schema.wt_ids), schema.wt_fields, ticks, values
 
 
 if __name__ == '__main__':
@@ -1,18 +1,152 @@
-from typing import Any, List
+from __future__ import annotations
+from typing import Any, Dict, List, Sequence, Tuple, TYPE_CHECKING
+import warnings
 import numpy as np
-import pandas as pd  # type: ignore
+import numpy.typing as npt
+
+if TYPE_CHECKING:
+    import pandas as pd  # type: ignore
 
 
 COOLDOWN = 100
-cooldowns = {}
+# Ticks until each alerted turbine can be alerted again
+cooldowns: Dict[str, int] = {}
+# Number of ticks the fault probabilities are averaged over, and the minimum
+# number of them that is required
+WINDOW = 30
+MIN_PERIODS = 20
+# Minimum number of ticks in the history before alerts are raised
+MIN_TICKS = 25
+
+_DenseT = Tuple[npt.NDArray[np.int64], List[str], npt.NDArray[np.float64],
+                List[str], npt.NDArray[np.bool_]]
 
 
 def get_fault_alerts(readings: Any, threshold: float = -0.08,
                      width: float = 0.05) -> List[str]:
+    ticks, wt_ids, values, fields, present = dense_readings(readings)
+    return _get_fault_alerts_dense(ticks, wt_ids, values, fields, present,
+                                   threshold, width)
+
+
+def get_fault_alerts_pandas(readings: Any, threshold: float = -0.08,
+                            width: float = 0.05) -> List[str]:
+    """The original implementation of `get_fault_alerts` with pandas, which
+    is much slower."""
+    import pandas as pd
     # Create a DataFrame from the readings
     wtss = [{**wt, 'ticks': r['ticks']} for r in readings for wt in r['wts']]
-    df = pd.DataFrame(wtss).sort_values('ticks')
-    if len(df.ticks.unique()) < 25:
+    df = pd.DataFrame(wtss)
+    return _get_fault_alerts(df, threshold, width)
+
+
+def dense_readings(readings: Any) -> _DenseT:
+    """Ticks in increasing order, turbine ids, values of shape [ticks,
+    turbines, fields] (NaN if missing), the numeric fields and the mask of
+    shape [ticks, turbines] of the turbines in each reading."""
+    readings = sorted(readings, key=lambda r: int(r['ticks']))
+    wt_index: Dict[str, int] = {}
+    field_index: Dict[str, int] = {}
+    for r in readings:
+        for wt in r['wts']:
+            wt_index.setdefault(wt['wt_id'], len(wt_index))
+            for k, v in wt.items():
+                if k != 'wt_id' and (v is None or isinstance(v, (int, float))):
+                    field_index.setdefault(k, len(field_index))
+    fields = list(field_index)
+    values = np.full((len(readings), len(wt_index), len(fields)), np.nan)
+    present = np.zeros(values.shape[:2], dtype=bool)
+    for i, r in enumerate(readings):
+        for wt in r['wts']:
+            j = wt_index[wt['wt_id']]
+            present[i, j] = True
+            values[i, j] = np.array([wt.get(k) for k in fields],
+                                    dtype=np.float64)
+    ticks = np.array([r['ticks'] for r in readings], dtype=np.int64)
+    return ticks, list(wt_index), values, fields, present
+
+
+def _get_fault_alerts_dense(ticks: npt.NDArray[np.int64], wt_ids: List[str],
+                            values: npt.NDArray[np.float64],
+                            fields: Sequence[str],
+                            present: npt.NDArray[np.bool_],
+                            threshold: float, width: float) -> List[str]:
+    """`get_fault_alerts` on dense arrays, see `dense_readings`."""
+    if len(np.unique(ticks)) < MIN_TICKS:
+        return []
+    order = np.argsort(ticks, kind='stable')
+    values = values[order]
+    present = present[order]
+    fprob = _fault_probability(values[..., list(fields).index('power')],
+                               present, threshold, width)
+    smooth = _rolling_mean(fprob, present)
+    # Like the pandas version, a turbine is predicted faulty if its averaged
+    # probability exceeded 0.5 at any tick, and it is in the last reading
+    # without missing values
+    pred = (smooth > 0.5).any(axis=0) & present[-1] \
+        & ~np.isnan(values[-1]).any(axis=1)
+    alerts = []
+    for i in np.flatnonzero(pred):
+        wt_id = wt_ids[i]
+        if wt_id in cooldowns:
+            continue
+        alerts.append(wt_id)
+        cooldowns[wt_id] = COOLDOWN
+    for k in list(cooldowns.keys()):
+        cooldowns[k] -= 1
+        if cooldowns[k] < 0:
+            del cooldowns[k]
+    return alerts
+
+
+def _fault_probability(power: npt.NDArray[np.float64],
+                       present: npt.NDArray[np.bool_], threshold: float,
+                       width: float) -> npt.NDArray[np.float64]:
+    """Fault probabilities of shape [ticks, turbines] from the deviation of
+    the power from the 75th percentile of all turbines in each tick."""
+    power = np.where(present, power, np.nan)
+    with warnings.catch_warnings():
+        # Ticks without any power readings
+        warnings.simplefilter('ignore', RuntimeWarning)
+        reference = np.nanquantile(power, 0.75, axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        dev = (power - reference) / reference
+        fprob: npt.NDArray[np.float64] = \
+            1 / (1 + np.exp((dev - threshold) / width))
+    return fprob
+
+
+def _rolling_mean(x: npt.NDArray[np.float64], present: npt.NDArray[np.bool_]
+                  ) -> npt.NDArray[np.float64]:
+    """Mean of the non-NaN values of the last `WINDOW` readings of each
+    turbine, if there are at least `MIN_PERIODS`, from cumulative sums. As
+    in pandas, the window is over the readings a turbine is present in."""
+    n = len(x)
+    # Readings of each turbine in tick order, the missing ones moved to the
+    # end
+    order = np.argsort(~present, axis=0, kind='stable')
+    compact = np.take_along_axis(x, order, axis=0)
+    valid = ~np.isnan(compact)
+    sums = np.zeros((n + 1, x.shape[1]))
+    np.cumsum(np.where(valid, compact, 0.), axis=0, out=sums[1:])
+    counts = np.zeros((n + 1, x.shape[1]), dtype=np.int64)
+    np.cumsum(valid, axis=0, out=counts[1:])
+    stop = np.arange(1, n + 1)
+    start = np.maximum(stop - WINDOW, 0)
+    count = counts[stop] - counts[start]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count >= MIN_PERIODS,
+                        (sums[stop] - sums[start]) / count, np.nan)
+    out = np.empty_like(x)
+    np.put_along_axis(out, order, mean, axis=0)
+    out[~present] = np.nan
+    return out
+
+
+def _get_fault_alerts(df: pd.DataFrame, threshold: float, width: float
+                      ) -> List[str]:
+    df = df.sort_values('ticks')
+    if len(df.ticks.unique()) < MIN_TICKS:
         return []
     # Get the fault probability based on the power readings
     dfprob = _get_fprob(df, 'power', threshold, width)
@@ -62,5 +196,95 @@ def _get_fprob(df: pd.DataFrame, col: str, threshold: float = -0.05,
                     .groupby('wt_id')
                     [f'{col}_fprob']
                     # See: https://github.com/pandas-dev/pandas/issues/38523
-                    .apply(lambda x: x.rolling(30, min_periods=20).mean()))
+                    .apply(lambda x: x.rolling(
+                        WINDOW, min_periods=MIN_PERIODS).mean()))
     return df[['wt_id', 'smooth']]
+
+
+class StreamingDetector:
+    """Online version of `get_fault_alerts`: `push` each new reading and call
+    `alerts` instead of the former, which gives the same alerts for a
+    history of the latest `history` readings. Like the batch version, a
+    turbine is predicted faulty if its averaged fault probability exceeded
+    0.5 at any tick of the history. The average over a full window is
+    computed once per tick, only the windows truncated by the start of the
+    history are recomputed on each call, both in O(turbines).
+
+    The cooldowns of the alerted turbines are the module's `cooldowns`, like
+    for the batch version, so that alerts are not raised again when the
+    detector is recreated, e.g. after the simulation restarted."""
+
+    def __init__(self, wt_ids: Sequence[str], history: int,
+                 threshold: float = -0.08, width: float = 0.05) -> None:
+        self.wt_ids = list(wt_ids)
+        self.history = history
+        self.threshold = threshold
+        self.width = width
+        self.cooldowns: Dict[str, int] = cooldowns
+        self.reset()
+
+    def reset(self) -> None:
+        n = len(self.wt_ids)
+        # Number of readings pushed so far, the row of the next one
+        self.count = 0
+        self.last_tick = -1
+        # Ring of the fault probabilities of the latest rows
+        self.fprobs = np.full((max(self.history, WINDOW), n), np.nan)
+        # Whether the latest reading of each turbine has no missing values
+        self.valid = np.zeros(n, dtype=bool)
+        # Latest row whose average over a full window exceeded 0.5
+        self.last_high = np.full(n, -1, dtype=np.int64)
+
+    def push(self, tick: int, values: npt.NDArray[np.float64],
+             power: int) -> None:
+        """Add the reading of `tick`, with `values` of shape [turbines,
+        fields] and the power in column `power`."""
+        if tick <= self.last_tick:
+            # The simulation was restarted
+            self.reset()
+        col = values[:, power]
+        reference = np.nanquantile(col, 0.75) \
+            if not np.isnan(col).all() else np.nan
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            dev = (col - reference) / reference
+            fprob = 1 / (1 + np.exp((dev - self.threshold) / self.width))
+        self.fprobs[self.count % len(self.fprobs)] = fprob
+        self.count += 1
+        self.last_tick = tick
+        self.valid = ~np.isnan(values).any(axis=1)
+        if self.count >= WINDOW:
+            high = self._high(self.count - WINDOW, self.count)[-1]
+            self.last_high[high] = self.count - 1
+
+    def alerts(self) -> List[str]:
+        rows = min(self.count, self.history)
+        if rows < MIN_TICKS:
+            return []
+        start = self.count - rows
+        pred = self.last_high >= start + WINDOW - 1
+        stop = min(start + WINDOW - 1, self.count)
+        if stop - start >= MIN_PERIODS:
+            pred |= self._high(start, stop).any(axis=0)
+        pred &= self.valid
+        alerts = []
+        for i in np.flatnonzero(pred):
+            wt_id = self.wt_ids[i]
+            if wt_id in self.cooldowns:
+                continue
+            alerts.append(wt_id)
+            self.cooldowns[wt_id] = COOLDOWN
+        for k in list(self.cooldowns.keys()):
+            self.cooldowns[k] -= 1
+            if self.cooldowns[k] < 0:
+                del self.cooldowns[k]
+        return alerts
+
+    def _high(self, start: int, stop: int) -> npt.NDArray[np.bool_]:
+        """Whether the averages of the rows from `start` to each row up to
+        `stop` exceed 0.5, of shape [rows, turbines]."""
+        fprobs = self.fprobs[np.arange(start, stop) % len(self.fprobs)]
+        present = np.cumsum(~np.isnan(fprobs), axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.cumsum(np.nan_to_num(fprobs), axis=0) / present
+        high: npt.NDArray[np.bool_] = (present >= MIN_PERIODS) & (mean > 0.5)
+        return high